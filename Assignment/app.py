@@ -1,63 +1,155 @@
-import os
-from flask import Flask, request, jsonify
+import hmac
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from flask_cors import CORS # Import CORS
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from werkzeug.local import LocalProxy
 
-from services.weather_service import WeatherService, WeatherAPIError, InvalidLocationError, RateLimitExceededError, OpenWeatherMapDownError
-from services.event_service import EventService, Event
+from config import Settings
+from services.admission import (ROUTE_CLASS_DB, ROUTE_CLASS_UPSTREAM, SHED_DEADLINE, AdmissionController,
+                                admission_class, reset_deadline, set_deadline)
+from services.container import ServiceContainer
+from services.profiling import RequestProfiler, span
 
-app = Flask(__name__)
-CORS(app) # Enable CORS for all origins
+from services.weather_service import WeatherAPIError, InvalidLocationError, RateLimitExceededError, OpenWeatherMapDownError, DeadlineExceededError
+from services.forecast_aggregation import parse_time_window
+from services.event_io import BulkFormatError, detect_format, export_events
 
-# MongoDB Connection
-MONGO_URI = "key"
-client = MongoClient(MONGO_URI)
-db = client.event_planner_db # You can choose your database name
+# Services are resolved per request from the app's ServiceContainer, so handlers can keep
+# referring to module-level names while the app itself stays cheap to construct.
+weather_service = LocalProxy(lambda: current_app.extensions["services"].weather_service)
+event_service = LocalProxy(lambda: current_app.extensions["services"].event_service)
+analytics_service = LocalProxy(lambda: current_app.extensions["services"].analytics_service)
 
-# Initialize services with MongoDB database
-OPENWEATHERMAP_BASE_URL = "http://api.openweathermap.org/data/2.5/"
-OPENWEATHER_API_KEY = "api"
-weather_service = WeatherService(OPENWEATHER_API_KEY, OPENWEATHERMAP_BASE_URL, db)
-event_service = EventService(weather_service, db)
+api = Blueprint("api", __name__)
 
-@app.route("/")
+@api.route("/")
+@admission_class(None)
 def home():
     return "Smart Event Planner Backend is running!"
 
+# Health checks
+@api.route("/health/live", methods=["GET"])
+@admission_class(None) # Always answered, even when shedding
+def liveness():
+    # The process is up and serving; deliberately touches no dependencies
+    return jsonify({"status": "alive"}), 200
+
+@api.route("/health/ready", methods=["GET"])
+@admission_class(None)
+def readiness():
+    try:
+        current_app.extensions["services"].ping()
+        return jsonify({"status": "ready"}), 200
+    except Exception as e:
+        return jsonify({"status": "unavailable", "error": f"MongoDB is not reachable: {str(e)}"}), 503
+
+# Admin
+def _is_admin_request():
+    admin_token = current_app.config["SETTINGS"].admin_token
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(admin_token) and hmac.compare_digest(supplied, admin_token)
+
+@api.route("/admin/profiles", methods=["GET"])
+@admission_class(None)
+def list_request_profiles():
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    profiler = current_app.extensions["profiler"]
+    return jsonify({
+        "slow_request_threshold_ms": profiler.slow_threshold_ms,
+        "sample_rate": profiler.sample_rate,
+        "profiles": profiler.list_profiles()
+    }), 200
+
+@api.route("/admin/profiles/<int:profile_id>", methods=["GET"])
+@admission_class(None)
+def get_request_profile(profile_id):
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    profile = current_app.extensions["profiler"].get_profile(profile_id)
+    if not profile:
+        return jsonify({"error": "Profile not found (it may have been evicted from the ring buffer)."}), 404
+    return jsonify(profile), 200
+
+@api.route("/admin/metrics", methods=["GET"])
+@admission_class(None)
+def get_admission_metrics():
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    admission = current_app.extensions.get("admission")
+    if admission is None:
+        return jsonify({"admission_control": False}), 200
+    # Per route class: limits, current load, and how many requests were admitted, queued or shed
+    return jsonify({"admission_control": True, "route_classes": admission.metrics()}), 200
+
 # Event Management
-@app.route("/events", methods=["POST"])
+@api.route("/events", methods=["POST"])
 def create_event():
     data = request.get_json()
     if not data or not all(key in data for key in ["name", "location", "date", "event_type"]):
         return jsonify({"error": "Missing event details"}), 400
 
     try:
-        event_dict = event_service.create_event(data["name"], data["location"], data["date"], data["event_type"])
+        event_dict = event_service.create_event(data["name"], data["location"], data["date"], data["event_type"],
+                                                start_time=data.get("start_time"), end_time=data.get("end_time"))
         return jsonify({
             "message": "Event created successfully",
             "event_id": event_dict["event_id"],
             "event": event_dict
         }), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except InvalidLocationError as e:
         return jsonify({"error": str(e)}), e.status_code
     except RateLimitExceededError as e:
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500 # Generic weather API error
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/events", methods=["GET"])
+@api.route("/events", methods=["GET"])
 def list_events():
     events_list = []
     for event_dict in event_service.get_all_events():
         events_list.append(event_dict)
     return jsonify(events_list), 200
 
-@app.route("/events/<int:event_id>", methods=["PUT"])
+@api.route("/events/bulk", methods=["POST"])
+def bulk_import_events():
+    # Accepts a JSON array, NDJSON or CSV body and streams it straight into batched inserts
+    try:
+        fmt = detect_format(request.content_type, explicit=request.args.get("format"))
+        batch_size = request.args.get("batch_size", type=int)
+        report = event_service.bulk_create_events(request.stream, fmt, batch_size=batch_size)
+        if report.get("aborted") and report["received"] == 0:
+            return jsonify({"error": report["aborted"]}), 400
+        status_code = 201 if report["inserted"] else 200
+        return jsonify(report), status_code
+    except BulkFormatError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@api.route("/events/export", methods=["GET"])
+def export_all_events():
+    try:
+        fmt = detect_format(explicit=request.args.get("format", "ndjson"))
+    except BulkFormatError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    mimetypes = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}
+    return Response(
+        stream_with_context(export_events(event_service.iter_all_events(), fmt)),
+        mimetype=mimetypes[fmt],
+        headers={"Content-Disposition": f"attachment; filename=events.{fmt}"}
+    )
+
+@api.route("/events/<int:event_id>", methods=["PUT"])
 def update_event(event_id):
     data = request.get_json()
     try:
@@ -65,7 +157,9 @@ def update_event(event_id):
                                            name=data.get("name"),
                                            location=data.get("location"),
                                            date_str=data.get("date"),
-                                           event_type=data.get("event_type"))
+                                           event_type=data.get("event_type"),
+                                           # Only fields present are passed, so an explicit null clears the time window
+                                           **{field: data[field] for field in ("start_time", "end_time") if field in data})
         if not event_dict:
             return jsonify({"error": "Event not found"}), 404
 
@@ -73,38 +167,55 @@ def update_event(event_id):
             "message": "Event updated successfully",
             "event": event_dict
         }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except InvalidLocationError as e:
         return jsonify({"error": str(e)}), e.status_code
     except RateLimitExceededError as e:
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
 # Weather Integration
-@app.route("/weather/<location>/<date>", methods=["GET"])
+def _time_window_from_args(start, end):
+    # Optional HH:MM start/end pair from a query string or JSON body
+    if start or end:
+        return parse_time_window(start, end)
+    return None
+
+@api.route("/weather/<location>/<date>", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def get_weather_for_location_date(location, date):
     try:
-        weather_data = weather_service.get_weather_data(location, date)
+        # Optional ?start=HH:MM&end=HH:MM or ?daypart=morning|afternoon|evening|night narrows the summary
+        time_window = _time_window_from_args(request.args.get("start"), request.args.get("end"))
+        weather_data = weather_service.get_weather_data(location, date, time_window=time_window, daypart=request.args.get("daypart"))
         if weather_data:
             return jsonify({"location": location, "date": date, "weather": weather_data}), 200
         else:
-            return jsonify({"error": "Could not retrieve weather data for the specified location and date (e.g., date out of forecast range)."}), 404
+            return jsonify({"error": "Could not retrieve weather data for the specified location and date (e.g., date out of forecast range, or no forecast for the requested period)."}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except InvalidLocationError as e:
         return jsonify({"error": str(e)}), e.status_code
     except RateLimitExceededError as e:
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/weather/<location>/<date>/hourly", methods=["GET"])
+@api.route("/weather/<location>/<date>/hourly", methods=["GET"])
 def get_hourly_weather_for_location_date(location, date):
     try:
         hourly_data, error = weather_service.get_hourly_forecast(location, date)
@@ -120,12 +231,15 @@ def get_hourly_weather_for_location_date(location, date):
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/weather/<location>/<date>/historical", methods=["GET"])
+@api.route("/weather/<location>/<date>/historical", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def get_historical_weather_for_location_date(location, date):
     try:
         historical_data, error = weather_service.get_historical_weather(location, date)
@@ -142,17 +256,42 @@ def get_historical_weather_for_location_date(location, date):
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except WeatherAPIError as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@api.route("/weather/<location>/history", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
+def get_historical_weather_range(location):
+    # Daily summaries from the local weather archive, e.g. ?start=2025-01-01&end=2025-03-31
+    try:
+        history, error = weather_service.get_historical_weather_range(location, request.args.get("start"), request.args.get("end"))
+        if history:
+            return jsonify(dict(history, location=location)), 200
+        return jsonify({"error": error.get("error", "An unknown error occurred.")}), error.get("status_code", 500)
+    except InvalidLocationError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except RateLimitExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except OpenWeatherMapDownError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/events/<int:event_id>/weather-check", methods=["POST"])
+@api.route("/events/<int:event_id>/weather-check", methods=["POST"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def analyze_event_weather(event_id):
     try:
         event_dict = event_service.analyze_event_weather(event_id)
         if not event_dict:
-            return jsonify({"error": "Event not found or weather data not available for analysis."}), 404
+            return jsonify({"error": "Event not found or weather data not available for the event's date and time window."}), 404
 
         return jsonify({
             "message": "Weather analyzed and updated for event",
@@ -166,12 +305,14 @@ def analyze_event_weather(event_id):
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/events/<int:event_id>/suitability", methods=["GET"])
+@api.route("/events/<int:event_id>/suitability", methods=["GET"])
 def get_event_suitability(event_id):
     suitability = event_service.get_event_suitability(event_id)
     if suitability:
@@ -185,7 +326,8 @@ def get_event_suitability(event_id):
     else:
         return jsonify({"message": "Weather suitability not yet calculated or available for this event.", "event_id": event_id}), 404
 
-@app.route("/events/<int:event_id>/alternatives", methods=["GET"])
+@api.route("/events/<int:event_id>/alternatives", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def get_alternative_dates(event_id):
     try:
         alternatives = event_service.get_alternative_dates(event_id)
@@ -207,12 +349,15 @@ def get_alternative_dates(event_id):
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/events/<int:event_id>/weather-trends", methods=["GET"])
+@api.route("/events/<int:event_id>/weather-trends", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def get_event_weather_trends(event_id):
     try:
         trends_data, error = event_service.get_weather_trends(event_id)
@@ -228,12 +373,15 @@ def get_event_weather_trends(event_id):
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/weather/compare-locations", methods=["POST"])
+@api.route("/weather/compare-locations", methods=["POST"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def compare_locations_weather():
     data = request.get_json()
     locations = data.get("locations")
@@ -244,25 +392,78 @@ def compare_locations_weather():
         return jsonify({"error": "Missing locations, date, or event_type"}), 400
     
     try:
-        results, error = event_service.compare_weather_across_locations(locations, target_date, event_type)
+        time_window = _time_window_from_args(data.get("start_time"), data.get("end_time"))
+        results, error = event_service.compare_weather_across_locations(locations, target_date, event_type,
+                                                                        time_window=time_window, daypart=data.get("daypart"))
         if results:
             return jsonify(results), 200
         elif error:
             return jsonify(error), error.get("status_code", 500)
         else:
             return jsonify({"message": "No comparison data available."}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except InvalidLocationError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except RateLimitExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except OpenWeatherMapDownError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except WeatherAPIError as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@api.route("/planner/optimize", methods=["POST"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
+def optimize_event_plan():
+    # Ranks location x date combinations for an event type in one request
+    data = request.get_json(silent=True) or {}
+    locations = data.get("locations")
+    event_type = data.get("event_type")
+    start_date = data.get("start_date")
+
+    if not all([locations, event_type, start_date]):
+        return jsonify({"error": "Missing locations, event_type, or start_date"}), 400
+    if not isinstance(locations, list):
+        return jsonify({"error": "locations must be a list"}), 400
+
+    try:
+        end_date = data.get("end_date") or (datetime.strptime(start_date, "%Y-%m-%d").date() + timedelta(days=5)).isoformat()
+        min_score = data.get("min_score")
+        plan = event_service.optimize_event_plan(
+            event_type,
+            locations,
+            start_date,
+            end_date,
+            top_k=int(data.get("top_k", 5)),
+            min_score=float(min_score) if min_score is not None else None,
+            exclude_dates=data.get("exclude_dates"),
+            preferred_daypart=data.get("preferred_daypart"),
+            time_window=_time_window_from_args(data.get("start_time"), data.get("end_time"))
+        )
+        if plan["results"]:
+            return jsonify(plan), 200
+        return jsonify(dict(plan, message="No location and date combination met the constraints.")), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     except InvalidLocationError as e:
         return jsonify({"error": str(e)}), e.status_code
     except RateLimitExceededError as e:
         return jsonify({"error": str(e)}), e.status_code
     except OpenWeatherMapDownError as e:
         return jsonify({"error": str(e)}), e.status_code
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except WeatherAPIError as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/events/<int:event_id>/weather-change-alert", methods=["GET"])
+@api.route("/events/<int:event_id>/weather-change-alert", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def get_weather_change_alert(event_id):
     try:
         alert_status = event_service.check_for_significant_weather_change(event_id)
@@ -277,10 +478,13 @@ def get_weather_change_alert(event_id):
         else:
             return jsonify(alert_status), 500 # General error from service
 
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
-@app.route("/events/<int:event_id>/reminder-summary", methods=["GET"])
+@api.route("/events/<int:event_id>/reminder-summary", methods=["GET"])
+@admission_class(ROUTE_CLASS_UPSTREAM)
 def get_event_reminder_summary(event_id):
     try:
         summary_data = event_service.generate_event_reminder_summary(event_id)
@@ -291,8 +495,167 @@ def get_event_reminder_summary(event_id):
         else:
             return jsonify(summary_data), 500 # General error from service
 
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+# Analytics
+MAX_ANALYTICS_RANGE_DAYS = 366
+
+def _analytics_date_range():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD, or the next ?days=N days (default 14) starting today
+    start, end = request.args.get("start"), request.args.get("end")
+    if start or end:
+        if not (start and end):
+            raise ValueError("Provide both start and end, or days.")
+        start_date = datetime.strptime(start, "%Y-%m-%d").date()
+        end_date = datetime.strptime(end, "%Y-%m-%d").date()
+    else:
+        days = int(request.args.get("days", 14))
+        if days < 1:
+            raise ValueError("days must be at least 1.")
+        start_date = datetime.now().date()
+        end_date = start_date + timedelta(days=days - 1)
+    if end_date < start_date:
+        raise ValueError("end must not be before start.")
+    if (end_date - start_date).days >= MAX_ANALYTICS_RANGE_DAYS:
+        raise ValueError(f"Date range is limited to {MAX_ANALYTICS_RANGE_DAYS} days.")
+    return start_date.isoformat(), end_date.isoformat()
+
+@api.route("/analytics/suitability", methods=["GET"])
+def get_suitability_analytics():
+    # Average suitability by location and event type, e.g. ?days=14&event_type=Sports
+    try:
+        start_date, end_date = _analytics_date_range()
+        results = analytics_service.suitability_summary(
+            start_date, end_date,
+            location=request.args.get("location"),
+            event_type=request.args.get("event_type")
+        )
+        return jsonify({"date_range": {"start": start_date, "end": end_date}, "results": results}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@api.route("/analytics/at-risk", methods=["GET"])
+def get_at_risk_analytics():
+    # Events whose last weather check scored "Poor", e.g. ?days=7&limit=20
+    try:
+        start_date, end_date = _analytics_date_range()
+        limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+        summary = analytics_service.at_risk_summary(start_date, end_date, limit=limit)
+        return jsonify(dict(summary, date_range={"start": start_date, "end": end_date})), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@api.route("/analytics/weather-outlook", methods=["GET"])
+def get_weather_outlook_analytics():
+    # Per-day conditions across all cached grid cells, e.g. ?days=5
+    try:
+        start_date, end_date = _analytics_date_range()
+        grid = current_app.config["SETTINGS"].weather_cache_grid_degrees
+        results = analytics_service.forecast_outlook(start_date, end_date, grid)
+        return jsonify({"date_range": {"start": start_date, "end": end_date}, "results": results}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+@api.route("/admin/analytics/rebuild", methods=["POST"])
+def rebuild_analytics_rollups():
+    # Recomputes the suitability rollups from the events collection
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        return jsonify(analytics_service.rebuild_rollups()), 200
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+def _start_request_profile():
+    # Admins can force a full profile (spans + stack samples) with X-Profile-Request: 1
+    force = request.headers.get("X-Profile-Request") == "1" and _is_admin_request()
+    g.request_profile = current_app.extensions["profiler"].start_request(request.method, request.path, force=force)
+
+def _record_response_status(response):
+    g.response_status_code = response.status_code
+    profile = g.get("request_profile")
+    if profile is not None and profile.sampled:
+        response.headers["X-Profile-Id"] = str(profile.profile_id)
+    return response
+
+def _finish_request_profile(exc):
+    current_app.extensions["profiler"].finish_request(g.pop("request_profile", None),
+                                                      g.get("response_status_code", 500 if exc else None))
+
+def _admit_request():
+    # Admission control: a concurrency slot in the route's class, and a deadline for the request
+    admission = current_app.extensions.get("admission")
+    view = current_app.view_functions.get(request.endpoint)
+    if admission is None or view is None or request.method == "OPTIONS":
+        return None
+    route_class = getattr(view, "admission_class", ROUTE_CLASS_DB)
+    if route_class is None:
+        return None
+
+    # Clients may send the time they are still willing to wait; it can only shorten the class default
+    deadline_seconds = admission.default_deadline_seconds(route_class)
+    requested_deadline = request.headers.get("X-Request-Deadline-Ms")
+    if requested_deadline:
+        try:
+            requested_seconds = float(requested_deadline) / 1000
+        except ValueError:
+            return jsonify({"error": "X-Request-Deadline-Ms must be a number of milliseconds."}), 400
+        deadline_seconds = min(deadline_seconds, requested_seconds) if deadline_seconds else requested_seconds
+    g.request_deadline_token = set_deadline(deadline_seconds)
+
+    with span("admission.wait", route_class=route_class):
+        shed_reason = admission.admit(route_class)
+    if shed_reason == SHED_DEADLINE:
+        return jsonify({"error": "Request deadline exceeded before the request was admitted."}), 504
+    if shed_reason:
+        response = jsonify({"error": "Server is busy. Please retry later.", "reason": shed_reason})
+        response.headers["Retry-After"] = str(admission.retry_after_seconds)
+        return response, 503
+    g.admission_class = route_class
+
+def _release_request(exc):
+    route_class = g.pop("admission_class", None)
+    if route_class is not None:
+        current_app.extensions["admission"].release(route_class, g.get("response_status_code", 500 if exc else None))
+    token = g.pop("request_deadline_token", None)
+    if token is not None:
+        reset_deadline(token)
+
+def create_app(settings=None):
+    settings = settings or Settings.from_env()
+    app = Flask(__name__)
+    app.config["SETTINGS"] = settings
+    CORS(app, origins=settings.cors_allowed_origins()) # Enable CORS for the configured origins
+
+    # Mongo client and services are created lazily on first use in each worker process
+    app.extensions["services"] = ServiceContainer(settings)
+    app.extensions["profiler"] = RequestProfiler(
+        sample_rate=settings.profile_sample_rate,
+        slow_threshold_ms=settings.slow_request_threshold_ms,
+        buffer_size=settings.profile_buffer_size,
+        sampler_interval_ms=settings.profile_sampler_interval_ms
+    )
+    if settings.admission_control:
+        app.extensions["admission"] = AdmissionController(settings.admission_limits(),
+                                                          retry_after_seconds=settings.admission_retry_after_seconds)
+    app.before_request(_start_request_profile)
+    app.before_request(_admit_request) # After profiling starts, so queue waits show up in profiles
+    app.after_request(_record_response_status)
+    app.teardown_request(_finish_request_profile)
+    app.teardown_request(_release_request)
+    app.register_blueprint(api)
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000, host="0.0.0.0") 
\ No newline at end of file
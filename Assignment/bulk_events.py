@@ -0,0 +1,72 @@
+import argparse
+import json
+import sys
+
+from config import Settings
+from services.container import ServiceContainer
+from services.event_io import BulkFormatError, SUPPORTED_FORMATS, detect_format, export_events
+
+# Command-line bulk import/export for events, e.g.
+#   python bulk_events.py import season.csv
+#   cat season.ndjson | python bulk_events.py import - --format ndjson
+#   python bulk_events.py export --format csv --output events.csv
+
+
+def import_events(event_service, args):
+    filename = None if args.path == "-" else args.path
+    fmt = detect_format(filename=filename, explicit=args.format)
+    if filename:
+        with open(filename, "rb") as stream:
+            report = event_service.bulk_create_events(stream, fmt, batch_size=args.batch_size)
+    else:
+        report = event_service.bulk_create_events(sys.stdin.buffer, fmt, batch_size=args.batch_size)
+
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] or report.get("aborted") else 0
+
+
+def export_all_events(event_service, args):
+    # Default to NDJSON on stdout; otherwise go by the output file extension
+    fmt = detect_format(filename=args.output, explicit=args.format or (None if args.output else "ndjson"))
+    output = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_events(event_service.iter_all_events(), fmt):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import or export Smart Event Planner events.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import events from a JSON array, NDJSON or CSV file ('-' for stdin).")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=SUPPORTED_FORMATS)
+    import_parser.add_argument("--batch-size", type=int, default=None)
+
+    export_parser = subparsers.add_parser("export", help="Export all events to stdout or a file.")
+    export_parser.add_argument("--format", choices=SUPPORTED_FORMATS)
+    export_parser.add_argument("--output")
+
+    args = parser.parse_args(argv)
+
+    # Built directly from the environment settings; no Flask app is needed for the CLI
+    container = ServiceContainer(Settings.from_env())
+    event_service = container.event_service
+
+    try:
+        if args.command == "import":
+            return import_events(event_service, args)
+        return export_all_events(event_service, args)
+    except BulkFormatError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        container.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import os
+
+# Application settings, read from the environment. Every setting has a default so the
+# app can be imported and constructed without any configuration or a reachable database.
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _parse_optional_latency(value):
+    # WEATHER_REPLAY_LATENCY_MS accepts a number of milliseconds or the word "recorded"
+    if value in (None, ""):
+        return None
+    if str(value).lower() == "recorded":
+        return "recorded"
+    return float(value)
+
+
+class Settings:
+    # setting name -> (environment variable, default, parser)
+    FIELDS = {
+        "mongo_uri": ("MONGO_URI", "mongodb://localhost:27017", str),
+        "mongo_db_name": ("MONGO_DB_NAME", "event_planner_db", str),
+        "mongo_max_pool_size": ("MONGO_MAX_POOL_SIZE", 50, int),
+        "mongo_min_pool_size": ("MONGO_MIN_POOL_SIZE", 0, int),
+        "mongo_server_selection_timeout_ms": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000, int),
+        "mongo_connect_timeout_ms": ("MONGO_CONNECT_TIMEOUT_MS", 5000, int),
+        "mongo_socket_timeout_ms": ("MONGO_SOCKET_TIMEOUT_MS", 10000, int),
+        "mongo_wait_queue_timeout_ms": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000, int),
+        "openweather_api_key": ("OPENWEATHER_API_KEY", "", str),
+        "openweathermap_base_url": ("OPENWEATHERMAP_BASE_URL", "http://api.openweathermap.org/data/2.5/", str),
+        "weather_cache_grid_degrees": ("WEATHER_CACHE_GRID_DEGREES", 0.1, float),
+        "weather_transport_mode": ("WEATHER_TRANSPORT_MODE", "live", str),
+        "weather_cassette_path": ("WEATHER_CASSETTE_PATH", None, str),
+        "weather_cassette_mmap": ("WEATHER_CASSETTE_MMAP", False, _parse_bool),
+        "weather_replay_latency_ms": ("WEATHER_REPLAY_LATENCY_MS", None, _parse_optional_latency),
+        "weather_cache_write_behind": ("WEATHER_CACHE_WRITE_BEHIND", True, _parse_bool),
+        "weather_cache_flush_batch_size": ("WEATHER_CACHE_FLUSH_BATCH_SIZE", 100, int),
+        "weather_cache_flush_interval_seconds": ("WEATHER_CACHE_FLUSH_INTERVAL_SECONDS", 1.0, float),
+        "weather_upstream_timeout_seconds": ("WEATHER_UPSTREAM_TIMEOUT_SECONDS", 10.0, float),
+        "weather_archive_path": ("WEATHER_ARCHIVE_PATH", "weather_archive", str), # Empty disables the archive
+        "admin_token": ("ADMIN_TOKEN", "", str), # Empty disables the admin endpoints and on-demand profiling
+        "profile_sample_rate": ("PROFILE_SAMPLE_RATE", 0.0, float),
+        "slow_request_threshold_ms": ("SLOW_REQUEST_THRESHOLD_MS", 1000.0, float), # 0 disables slow-request capture
+        "profile_buffer_size": ("PROFILE_BUFFER_SIZE", 50, int),
+        "profile_sampler_interval_ms": ("PROFILE_SAMPLER_INTERVAL_MS", 5.0, float),
+        "admission_control": ("ADMISSION_CONTROL", True, _parse_bool),
+        "admission_upstream_max_concurrent": ("ADMISSION_UPSTREAM_MAX_CONCURRENT", 8, int),
+        "admission_upstream_max_queued": ("ADMISSION_UPSTREAM_MAX_QUEUED", 16, int),
+        "admission_upstream_queue_timeout_ms": ("ADMISSION_UPSTREAM_QUEUE_TIMEOUT_MS", 2000.0, float),
+        "admission_upstream_deadline_ms": ("ADMISSION_UPSTREAM_DEADLINE_MS", 15000.0, float), # 0 disables the default deadline
+        "admission_db_max_concurrent": ("ADMISSION_DB_MAX_CONCURRENT", 32, int),
+        "admission_db_max_queued": ("ADMISSION_DB_MAX_QUEUED", 64, int),
+        "admission_db_queue_timeout_ms": ("ADMISSION_DB_QUEUE_TIMEOUT_MS", 1000.0, float),
+        "admission_db_deadline_ms": ("ADMISSION_DB_DEADLINE_MS", 5000.0, float),
+        "admission_retry_after_seconds": ("ADMISSION_RETRY_AFTER_SECONDS", 1, int),
+        "cors_origins": ("CORS_ORIGINS", "*", str),
+    }
+
+    def __init__(self, **overrides):
+        unknown = set(overrides) - set(self.FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        for name, (_, default, _) in self.FIELDS.items():
+            setattr(self, name, overrides.get(name, default))
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides):
+        environ = os.environ if environ is None else environ
+        values = {}
+        for name, (env_var, _, parser) in cls.FIELDS.items():
+            if env_var in environ:
+                try:
+                    values[name] = parser(environ[env_var])
+                except ValueError:
+                    raise ValueError(f"Invalid value for {env_var}: {environ[env_var]!r}")
+        values.update(overrides)
+        return cls(**values)
+
+    def mongo_client_options(self):
+        return {
+            "maxPoolSize": self.mongo_max_pool_size,
+            "minPoolSize": self.mongo_min_pool_size,
+            "serverSelectionTimeoutMS": self.mongo_server_selection_timeout_ms,
+            "connectTimeoutMS": self.mongo_connect_timeout_ms,
+            "socketTimeoutMS": self.mongo_socket_timeout_ms,
+            "waitQueueTimeoutMS": self.mongo_wait_queue_timeout_ms,
+            "connect": False, # Don't open sockets until the first operation
+        }
+
+    def cors_allowed_origins(self):
+        # CORS_ORIGINS is "*" or a comma-separated list of origins
+        origins = self.cors_origins
+        if isinstance(origins, str):
+            if origins.strip() == "*":
+                return "*"
+            origins = origins.split(",")
+        return [origin.strip() for origin in origins if origin.strip()]
+
+    def admission_limits(self):
+        # route class -> (max concurrent, max queued, queue timeout ms, default deadline ms)
+        return {
+            "upstream": (self.admission_upstream_max_concurrent, self.admission_upstream_max_queued,
+                         self.admission_upstream_queue_timeout_ms, self.admission_upstream_deadline_ms),
+            "db": (self.admission_db_max_concurrent, self.admission_db_max_queued,
+                   self.admission_db_queue_timeout_ms, self.admission_db_deadline_ms),
+        }
@@ -0,0 +1,134 @@
+import contextvars
+import threading
+import time
+
+# Admission control and request deadlines.
+#   * Routes are grouped into classes ("upstream" for handlers that may call OpenWeatherMap,
+#     "db" for handlers that only touch MongoDB). Each class has its own concurrency limit and
+#     a bounded wait queue, so a burst of slow upstream calls cannot starve cheap DB-only routes.
+#     A request that finds the queue full, or waits longer than the queue timeout, is shed.
+#   * Every admitted request carries a deadline in a context variable. WeatherService bounds
+#     upstream timeouts by the time left and abandons work once the deadline has passed.
+# Limits are per worker process; a pre-fork server's workers each admit their own share.
+
+ROUTE_CLASS_UPSTREAM = "upstream"
+ROUTE_CLASS_DB = "db"
+
+SHED_QUEUE_FULL = "queue_full"
+SHED_QUEUE_TIMEOUT = "queue_timeout"
+SHED_DEADLINE = "deadline"
+
+_deadline = contextvars.ContextVar("request_deadline", default=None) # time.monotonic() value
+
+
+def set_deadline(timeout_seconds):
+    # Returns a token for reset_deadline; None clears the deadline
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds is not None else None
+    return _deadline.set(deadline)
+
+
+def reset_deadline(token):
+    try:
+        _deadline.reset(token)
+    except ValueError:
+        _deadline.set(None) # Reset from a different context than it was set in
+
+
+def remaining_seconds():
+    # Seconds left before the current request's deadline, or None when there is no deadline
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def admission_class(name):
+    # View decorator (applied below @api.route) assigning a route class; None exempts the route
+    def decorator(view):
+        view.admission_class = name
+        return view
+    return decorator
+
+
+class _RouteClassLimiter:
+    def __init__(self, name, max_concurrent, max_queued, queue_timeout_ms, deadline_ms):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_ms / 1000
+        self.deadline_seconds = deadline_ms / 1000 if deadline_ms else None
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+        self.stats = {
+            "admitted": 0, "queued": 0, "completed": 0, "peak_in_flight": 0, "queue_wait_ms_total": 0.0,
+            "shed_queue_full": 0, "shed_queue_timeout": 0, "shed_deadline": 0, "deadline_exceeded": 0
+        }
+
+    def acquire(self, deadline_remaining=None):
+        # Returns None when admitted, otherwise the reason the request was shed
+        with self._condition:
+            if deadline_remaining is not None and deadline_remaining <= 0:
+                self.stats["shed_deadline"] += 1
+                return SHED_DEADLINE
+            if self.in_flight >= self.max_concurrent:
+                if self.waiting >= self.max_queued:
+                    self.stats["shed_queue_full"] += 1
+                    return SHED_QUEUE_FULL
+                started = time.monotonic()
+                wait_seconds = self.queue_timeout_seconds
+                if deadline_remaining is not None:
+                    wait_seconds = min(wait_seconds, deadline_remaining)
+                wait_until = started + wait_seconds
+                self.waiting += 1
+                try:
+                    while self.in_flight >= self.max_concurrent:
+                        remaining = wait_until - time.monotonic()
+                        if remaining <= 0:
+                            self.stats["shed_queue_timeout"] += 1
+                            return SHED_QUEUE_TIMEOUT
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+                self.stats["queued"] += 1
+                self.stats["queue_wait_ms_total"] += (time.monotonic() - started) * 1000
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+            return None
+
+    def release(self, status_code=None):
+        with self._condition:
+            self.in_flight -= 1
+            self.stats["completed"] += 1
+            if status_code == 504:
+                self.stats["deadline_exceeded"] += 1
+            self._condition.notify()
+
+    def metrics(self):
+        with self._condition:
+            metrics = dict(self.stats, max_concurrent=self.max_concurrent, max_queued=self.max_queued,
+                           in_flight=self.in_flight, waiting=self.waiting)
+        metrics["queue_wait_ms_total"] = round(metrics["queue_wait_ms_total"], 3)
+        return metrics
+
+
+class AdmissionController:
+    def __init__(self, limits, retry_after_seconds=1):
+        # limits: {route class: (max_concurrent, max_queued, queue_timeout_ms, default deadline_ms)}
+        self.retry_after_seconds = retry_after_seconds
+        self._limiters = {name: _RouteClassLimiter(name, *limit) for name, limit in limits.items()}
+
+    def default_deadline_seconds(self, route_class):
+        return self._limiters[route_class].deadline_seconds
+
+    def admit(self, route_class):
+        # Waits for a slot, but never past the request's own deadline. Returns None when
+        # admitted, otherwise the shed reason; admitted requests must call release().
+        return self._limiters[route_class].acquire(remaining_seconds())
+
+    def release(self, route_class, status_code=None):
+        self._limiters[route_class].release(status_code)
+
+    def metrics(self):
+        return {name: limiter.metrics() for name, limiter in self._limiters.items()}
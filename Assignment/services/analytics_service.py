@@ -0,0 +1,154 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+# Server-side analytics over events and the weather cache.
+# Suitability results are rolled up per (date, location, event_type) into the
+# event_suitability_rollups collection as events are analyzed, so dashboards aggregate a
+# handful of rollup documents instead of scanning every event. rebuild_rollups() recomputes
+# the collection from scratch with a single $group/$merge pipeline.
+
+SUITABILITY_LEVELS = ("good", "okay", "poor")
+
+
+class AnalyticsService:
+    def __init__(self, db):
+        self.events_collection = db.events
+        self.weather_cache_collection = db.weather_cache
+        self.location_grid_collection = db.location_grid
+        self.rollups_collection = db.event_suitability_rollups
+
+    def ensure_indexes(self):
+        # Idempotent; supports the event lookups, the cache key and the analytics range scans
+        self.events_collection.create_index([("event_id", ASCENDING)])
+        self.events_collection.create_index([("date", ASCENDING), ("location", ASCENDING), ("event_type", ASCENDING)])
+        self.events_collection.create_index([("suitability_score.text", ASCENDING), ("date", ASCENDING)])
+        self.weather_cache_collection.create_index([("cell", ASCENDING), ("grid", ASCENDING), ("date", ASCENDING)])
+        self.weather_cache_collection.create_index([("date", ASCENDING)])
+        self.location_grid_collection.create_index([("location", ASCENDING), ("grid", ASCENDING)])
+        self.rollups_collection.create_index([("date", ASCENDING), ("location", ASCENDING), ("event_type", ASCENDING)], unique=True)
+
+    def _contribution(self, event):
+        # (rollup key, score, level) an analyzed event adds to the rollups, or None
+        suitability = (event or {}).get("suitability_score")
+        if not suitability or suitability.get("text") is None:
+            return None
+        key = {"date": event["date"], "location": event["location"], "event_type": event["event_type"]}
+        return key, suitability.get("score", 0), suitability["text"].lower()
+
+    def record_suitability_change(self, previous_event, current_event):
+        # Incremental refresh: withdraw the event's previous contribution and add the new one
+        previous = self._contribution(previous_event)
+        current = self._contribution(current_event)
+        if previous == current:
+            return
+
+        now = datetime.now().isoformat()
+        operations = []
+        if previous:
+            key, score, level = previous
+            operations.append(UpdateOne(key, {"$inc": {"events": -1, "score_sum": -score, level: -1}, "$set": {"updated_at": now}}))
+        if current:
+            key, score, level = current
+            operations.append(UpdateOne(key, {"$inc": {"events": 1, "score_sum": score, level: 1}, "$set": {"updated_at": now}}, upsert=True))
+        self.rollups_collection.bulk_write(operations, ordered=True)
+
+    def rebuild_rollups(self):
+        # Full refresh for events analyzed before rollups existed, or to correct drift
+        started = datetime.now().isoformat()
+        pipeline = [
+            {"$match": {"suitability_score.text": {"$in": ["Good", "Okay", "Poor"]}}},
+            {"$group": {
+                "_id": {"date": "$date", "location": "$location", "event_type": "$event_type"},
+                "events": {"$sum": 1},
+                "score_sum": {"$sum": "$suitability_score.score"},
+                **{level: {"$sum": {"$cond": [{"$eq": ["$suitability_score.text", level.capitalize()]}, 1, 0]}}
+                   for level in SUITABILITY_LEVELS}
+            }},
+            {"$project": {
+                "_id": 0,
+                "date": "$_id.date",
+                "location": "$_id.location",
+                "event_type": "$_id.event_type",
+                "events": 1,
+                "score_sum": 1,
+                **{level: 1 for level in SUITABILITY_LEVELS},
+                "updated_at": {"$literal": started}
+            }},
+            {"$merge": {"into": self.rollups_collection.name, "on": ["date", "location", "event_type"],
+                        "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+        self.events_collection.aggregate(pipeline)
+        # Rollups no event contributed to in this pass (and no analysis touched since) are stale
+        removed = self.rollups_collection.delete_many({"updated_at": {"$lt": started}}).deleted_count
+        return {"rollups": self.rollups_collection.count_documents({}), "removed": removed}
+
+    def suitability_summary(self, start_date, end_date, location=None, event_type=None):
+        # Average suitability by location and event type over [start_date, end_date], from rollups
+        match = {"date": {"$gte": start_date, "$lte": end_date}, "events": {"$gt": 0}}
+        if location:
+            match["location"] = location
+        if event_type:
+            match["event_type"] = event_type
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"location": "$location", "event_type": "$event_type"},
+                "events": {"$sum": "$events"},
+                "score_sum": {"$sum": "$score_sum"},
+                **{level: {"$sum": f"${level}"} for level in SUITABILITY_LEVELS}
+            }},
+            {"$project": {
+                "_id": 0,
+                "location": "$_id.location",
+                "event_type": "$_id.event_type",
+                "events": 1,
+                "average_score": {"$round": [{"$divide": ["$score_sum", "$events"]}, 1]},
+                **{level: 1 for level in SUITABILITY_LEVELS}
+            }},
+            {"$sort": {"average_score": DESCENDING, "location": ASCENDING}}
+        ]
+        return list(self.rollups_collection.aggregate(pipeline))
+
+    def at_risk_summary(self, start_date, end_date, limit=50):
+        # Events scored "Poor" in the window: counts per location from rollups, plus the events themselves
+        counts = list(self.rollups_collection.aggregate([
+            {"$match": {"date": {"$gte": start_date, "$lte": end_date}, "poor": {"$gt": 0}}},
+            {"$group": {"_id": "$location", "events_at_risk": {"$sum": "$poor"}}},
+            {"$project": {"_id": 0, "location": "$_id", "events_at_risk": 1}},
+            {"$sort": {"events_at_risk": DESCENDING, "location": ASCENDING}}
+        ]))
+        events = list(self.events_collection.aggregate([
+            {"$match": {"suitability_score.text": "Poor", "date": {"$gte": start_date, "$lte": end_date}}},
+            {"$sort": {"date": ASCENDING, "event_id": ASCENDING}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "event_id": 1, "name": 1, "location": 1, "date": 1, "event_type": 1, "suitability_score": 1}}
+        ]))
+        return {
+            "total_events_at_risk": sum(row["events_at_risk"] for row in counts),
+            "by_location": counts,
+            "events": events
+        }
+
+    def forecast_outlook(self, start_date, end_date, grid):
+        # Per-day conditions across every cached grid cell, straight from the weather cache
+        pipeline = [
+            {"$match": {"date": {"$gte": start_date, "$lte": end_date}, "grid": grid}},
+            {"$group": {
+                "_id": "$date",
+                "cells": {"$sum": 1},
+                "average_temperature": {"$avg": "$data.temperature"},
+                "max_precipitation": {"$max": "$data.precipitation"},
+                "wet_cells": {"$sum": {"$cond": [{"$in": ["$data.main", ["Rain", "Drizzle", "Thunderstorm", "Snow"]]}, 1, 0]}}
+            }},
+            {"$project": {
+                "_id": 0,
+                "date": "$_id",
+                "cells": 1,
+                "average_temperature": {"$round": ["$average_temperature", 1]},
+                "max_precipitation": 1,
+                "wet_cells": 1
+            }},
+            {"$sort": {"date": ASCENDING}}
+        ]
+        return list(self.weather_cache_collection.aggregate(pipeline))
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+from pymongo import UpdateOne
+
+# Write-behind queue for weather cache upserts. Requests hand their cache writes to the
+# queue and return immediately; a background thread flushes them with one unordered
+# bulk_write when the batch is full or the flush interval passes, and once more on shutdown.
+# Only cache data goes through here: losing queued writes on a crash just means a cache miss.
+
+
+class WriteBehindQueue:
+    def __init__(self, collection, max_batch_size=100, flush_interval_seconds=1.0, max_pending=10000):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_pending = max_pending
+        self._pending = {} # key -> (filter, fields); a newer write for the same key replaces the older one
+        self._in_flight = {} # The batch currently being written, still readable until the write completes
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.stats = {"enqueued": 0, "coalesced": 0, "flushed": 0, "dropped": 0, "failed": 0, "batches": 0}
+
+    def _ensure_worker(self):
+        # Called with the condition held. Threads don't survive fork, so start one per process.
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="weather-cache-write-behind", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, key, filter, fields):
+        with self._condition:
+            if self._closed:
+                # After shutdown there is no worker left, so write through
+                self.collection.update_one(filter, {"$set": fields}, upsert=True)
+                return
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+                del self._pending[key] # Re-insert so the entry moves to the back of the queue
+            elif len(self._pending) >= self.max_pending:
+                # Mongo is not keeping up; shed the oldest cache write rather than grow without bound
+                del self._pending[next(iter(self._pending))]
+                self.stats["dropped"] += 1
+            self._pending[key] = (filter, fields)
+            self.stats["enqueued"] += 1
+            self._ensure_worker()
+            if len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+
+    def get_pending(self, key):
+        # Read-your-writes for values that are queued but not yet flushed
+        with self._condition:
+            entry = self._pending.get(key) or self._in_flight.get(key)
+            return entry[1] if entry else None
+
+    def pending_count(self):
+        with self._condition:
+            return len(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                if not self._pending:
+                    return 0
+                batch = self._in_flight = self._pending
+                self._pending = {}
+
+            requests = [UpdateOne(filter, {"$set": fields}, upsert=True) for filter, fields in batch.values()]
+            try:
+                self.collection.bulk_write(requests, ordered=False)
+                self.stats["flushed"] += len(requests)
+            except Exception as e:
+                # Cache writes are best effort; the next fetch for these keys will simply miss
+                self.stats["failed"] += len(requests)
+                print(f"Failed to flush {len(requests)} weather cache writes: {e}")
+            with self._condition:
+                self._in_flight = {}
+            self.stats["batches"] += 1
+            return len(requests)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                deadline = time.monotonic() + self.flush_interval_seconds
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self.flush()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout=self.flush_interval_seconds + 5)
+        self.flush()
@@ -0,0 +1,135 @@
+import atexit
+import os
+import threading
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from .analytics_service import AnalyticsService
+from .cache_writer import WriteBehindQueue
+from .event_service import EventService
+from .weather_archive import WeatherArchive
+from .weather_service import WeatherService
+from .weather_transport import build_transport
+
+# Lazily builds the Mongo client and services on first use, once per process.
+# Nothing is connected at import or app-construction time, and a pre-fork server's
+# workers each build their own client, sockets and cassette file handles after the fork.
+
+
+class ServiceContainer:
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._pid = None
+        self._client = None
+        self._weather_service = None
+        self._event_service = None
+        self._analytics_service = None
+        self._cache_write_behind = None
+        self._weather_archive = None
+        self._atexit_registered = False
+
+    def _ensure_process(self):
+        # Objects inherited from a parent process are dropped, never closed: closing
+        # them here would tear down sockets and file handles the parent still uses.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._client = None
+            self._weather_service = None
+            self._event_service = None
+            self._analytics_service = None
+            self._cache_write_behind = None
+            self._weather_archive = None
+
+    @property
+    def client(self):
+        with self._lock:
+            self._ensure_process()
+            if self._client is None:
+                self._client = MongoClient(self.settings.mongo_uri, **self.settings.mongo_client_options())
+                # Once per connection, before any route queries the collections
+                try:
+                    AnalyticsService(self._client[self.settings.mongo_db_name]).ensure_indexes()
+                except PyMongoError as e:
+                    # Indexes only speed things up; serve without them rather than fail the request
+                    print(f"Failed to ensure MongoDB indexes: {e}")
+            return self._client
+
+    @property
+    def db(self):
+        return self.client[self.settings.mongo_db_name]
+
+    @property
+    def weather_service(self):
+        db = self.db
+        with self._lock:
+            if self._weather_service is None:
+                transport = build_transport(
+                    mode=self.settings.weather_transport_mode,
+                    cassette_path=self.settings.weather_cassette_path,
+                    use_mmap=self.settings.weather_cassette_mmap,
+                    latency_ms=self.settings.weather_replay_latency_ms
+                )
+                if self.settings.weather_cache_write_behind:
+                    self._cache_write_behind = WriteBehindQueue(
+                        db.weather_cache,
+                        max_batch_size=self.settings.weather_cache_flush_batch_size,
+                        flush_interval_seconds=self.settings.weather_cache_flush_interval_seconds
+                    )
+                    if not self._atexit_registered:
+                        # Flush queued cache writes when the worker shuts down cleanly
+                        atexit.register(self.close)
+                        self._atexit_registered = True
+                if self.settings.weather_archive_path:
+                    self._weather_archive = WeatherArchive(self.settings.weather_archive_path, self.settings.weather_cache_grid_degrees)
+                self._weather_service = WeatherService(
+                    self.settings.openweather_api_key,
+                    self.settings.openweathermap_base_url,
+                    db,
+                    cache_grid_degrees=self.settings.weather_cache_grid_degrees,
+                    transport=transport,
+                    cache_write_behind=self._cache_write_behind,
+                    archive=self._weather_archive,
+                    upstream_timeout_seconds=self.settings.weather_upstream_timeout_seconds,
+                    clock=getattr(transport, "now", None) # Set by the replay transport only
+                )
+            return self._weather_service
+
+    @property
+    def analytics_service(self):
+        db = self.db
+        with self._lock:
+            if self._analytics_service is None:
+                self._analytics_service = AnalyticsService(db)
+            return self._analytics_service
+
+    @property
+    def event_service(self):
+        weather_service = self.weather_service
+        analytics_service = self.analytics_service
+        db = self.db
+        with self._lock:
+            if self._event_service is None:
+                self._event_service = EventService(weather_service, db, analytics=analytics_service)
+            return self._event_service
+
+    def ping(self):
+        # Readiness check: a round trip to the server, bounded by serverSelectionTimeoutMS
+        self.client.admin.command("ping")
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                if self._cache_write_behind is not None:
+                    self._cache_write_behind.close() # Flush before the client goes away
+                if self._weather_archive is not None:
+                    self._weather_archive.close() # Unmaps partitions and closes their file handles
+                if self._client is not None:
+                    self._client.close()
+            self._cache_write_behind = None
+            self._weather_archive = None
+            self._client = None
+            self._weather_service = None
+            self._event_service = None
+            self._analytics_service = None
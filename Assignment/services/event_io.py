@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+from .forecast_aggregation import parse_time_window
+
+# Streaming readers/writers for bulk event import and export.
+# Every reader yields (row_number, row_dict_or_None, error_or_None) one row at a time,
+# so memory use stays flat regardless of the size of the input.
+
+EVENT_FIELDS = ["name", "location", "date", "event_type"]
+OPTIONAL_EVENT_FIELDS = ["start_time", "end_time"]
+EXPORT_FIELDS = ["event_id", "name", "location", "date", "event_type", "start_time", "end_time", "weather_data", "suitability_score"]
+SUPPORTED_FORMATS = ("json", "ndjson", "csv")
+
+READ_CHUNK_SIZE = 64 * 1024
+MAX_ELEMENT_CHARS = 1024 * 1024 # Longest single JSON array element we will buffer
+
+
+class BulkFormatError(Exception):
+    """Exception raised when a bulk payload cannot be parsed at all."""
+    def __init__(self, message="Malformed bulk payload.", status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def detect_format(content_type=None, filename=None, explicit=None):
+    # An explicit ?format= wins, then the file extension, then the Content-Type header
+    if explicit:
+        fmt = explicit.lower()
+    elif filename and "." in filename:
+        fmt = filename.rsplit(".", 1)[1].lower()
+    else:
+        mimetype = (content_type or "").split(";")[0].strip().lower()
+        fmt = {
+            "application/json": "json",
+            "application/x-ndjson": "ndjson",
+            "application/ndjson": "ndjson",
+            "application/jsonl": "ndjson",
+            "text/csv": "csv",
+        }.get(mimetype, "json")
+    if fmt == "jsonl":
+        fmt = "ndjson"
+    if fmt not in SUPPORTED_FORMATS:
+        raise BulkFormatError(f"Unsupported bulk format '{fmt}'. Use one of: {', '.join(SUPPORTED_FORMATS)}.")
+    return fmt
+
+
+def validate_event_row(row):
+    # Returns (clean_row, None) or (None, error_message)
+    if not isinstance(row, dict):
+        return None, "Row must be an object with name, location, date and event_type."
+
+    missing = [field for field in EVENT_FIELDS if not row.get(field)]
+    if missing:
+        return None, f"Missing event details: {', '.join(missing)}"
+
+    clean = {field: str(row[field]).strip() for field in EVENT_FIELDS}
+    try:
+        datetime.strptime(clean["date"], "%Y-%m-%d")
+    except ValueError:
+        return None, f"Invalid date '{clean['date']}', expected YYYY-MM-DD."
+
+    start_time, end_time = (str(row.get(field) or "").strip() or None for field in OPTIONAL_EVENT_FIELDS)
+    if start_time or end_time:
+        try:
+            parse_time_window(start_time, end_time)
+        except ValueError as e:
+            return None, str(e)
+        clean["start_time"], clean["end_time"] = start_time, end_time
+    return clean, None
+
+
+def _text_stream(binary_stream):
+    # Decode incrementally instead of reading the whole body into memory. newline="" splits
+    # lines on \n/\r only, so raw U+2028 and friends inside JSON strings stay in their row,
+    # and hands csv the untranslated line endings it expects.
+    return io.TextIOWrapper(binary_stream, encoding="utf-8", errors="replace", newline="")
+
+
+# Outside a string, the characters that change nesting or end an element; inside one, its terminators
+_STRUCTURAL_CHARS = re.compile(r'["\[\]{},]')
+_STRING_CHARS = re.compile(r'["\\]')
+
+
+def iter_json_array(binary_stream):
+    # Splits the array into elements with a string-aware bracket scanner, then decodes each
+    # element on its own: a malformed element is reported as a row error and parsing resumes
+    # at the next top-level "," or "]", without reading further ahead than that.
+    reader = _text_stream(binary_stream)
+    buffer = ""
+    position = 0
+    eof = False
+    row_number = 0
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = reader.read(READ_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            return
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def next_char():
+        # First non-whitespace character at or after position, or None at the end of input
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if eof:
+                return None
+            fill()
+
+    def find_element_end():
+        # Index of the top-level "," or "]" that ends the element starting at position
+        depth = 0
+        in_string = False
+        index = position
+        while True:
+            match = (_STRING_CHARS if in_string else _STRUCTURAL_CHARS).search(buffer, index)
+            if match is None or (match.group() == "\\" and match.start() + 1 >= len(buffer)):
+                if eof:
+                    raise BulkFormatError(f"Unexpected end of JSON array in element {row_number + 1}.")
+                if len(buffer) - position > MAX_ELEMENT_CHARS:
+                    raise BulkFormatError(f"Element {row_number + 1} is longer than {MAX_ELEMENT_CHARS} characters.")
+                offset = (match.start() if match else len(buffer)) - position
+                fill()
+                index = position + offset
+                continue
+            char = match.group()
+            index = match.end()
+            if in_string:
+                if char == "\\":
+                    index += 1 # Skip the escaped character
+                else:
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "[{":
+                depth += 1
+            elif char in "]}" and depth > 0:
+                depth -= 1
+            elif depth == 0 and char in ",]":
+                return match.start()
+            # A stray "}" at depth 0 stays in the element and fails to decode there
+
+    char = next_char()
+    if char is None:
+        raise BulkFormatError("Empty JSON payload, expected an array of events.")
+    if char != "[":
+        raise BulkFormatError("JSON payload must be an array of events.")
+    position += 1
+
+    if next_char() == "]":
+        position += 1
+    else:
+        while True:
+            end = find_element_end()
+            text = buffer[position:end]
+            delimiter = buffer[end]
+            position = end + 1
+            row_number += 1
+            if not text.strip():
+                yield row_number, None, "Expected an event between commas."
+            else:
+                try:
+                    value = json.loads(text)
+                except json.JSONDecodeError as e:
+                    yield row_number, None, f"Malformed JSON: {e.msg}"
+                else:
+                    row, error = validate_event_row(value)
+                    yield row_number, row, error
+            if delimiter == "]":
+                break
+
+    if next_char() is not None:
+        raise BulkFormatError("Unexpected data after the JSON array.")
+
+
+def iter_ndjson(binary_stream):
+    row_number = 0
+    for line in _text_stream(binary_stream):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, None, f"Malformed JSON: {e.msg}"
+            continue
+        row, error = validate_event_row(value)
+        yield row_number, row, error
+
+
+def iter_csv(binary_stream):
+    reader = csv.DictReader(_text_stream(binary_stream))
+    if reader.fieldnames is None:
+        raise BulkFormatError("Empty CSV payload, expected a header row.")
+    missing = [field for field in EVENT_FIELDS if field not in reader.fieldnames]
+    if missing:
+        raise BulkFormatError(f"CSV header is missing columns: {', '.join(missing)}")
+    for row_number, value in enumerate(reader, start=1):
+        row, error = validate_event_row(value)
+        yield row_number, row, error
+
+
+def iter_event_rows(binary_stream, fmt):
+    if fmt == "json":
+        return iter_json_array(binary_stream)
+    if fmt == "ndjson":
+        return iter_ndjson(binary_stream)
+    return iter_csv(binary_stream)
+
+
+def export_events(events, fmt):
+    # Yields text chunks for a streaming response (or a file), one event at a time
+    if fmt == "ndjson":
+        for event in events:
+            yield json.dumps(event) + "\n"
+    elif fmt == "csv":
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield line.getvalue()
+        for event in events:
+            line.seek(0)
+            line.truncate(0)
+            # Nested weather fields are written as JSON so the file round-trips
+            writer.writerow({
+                field: json.dumps(event.get(field)) if isinstance(event.get(field), (dict, list)) else event.get(field)
+                for field in EXPORT_FIELDS
+            })
+            yield line.getvalue()
+    else:
+        yield "["
+        first = True
+        for event in events:
+            yield ("" if first else ",") + json.dumps(event)
+            first = False
+        yield "]\n"
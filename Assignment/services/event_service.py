@@ -1,13 +1,23 @@
+import heapq
 from datetime import datetime, timedelta
-from .weather_service import InvalidLocationError, OpenWeatherMapDownError, RateLimitExceededError, WeatherAPIError, WeatherService
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, PyMongoError
+from .event_io import BulkFormatError, iter_event_rows
+from .forecast_aggregation import DAYPARTS, parse_time_window, slot_from_forecast_item
+from .profiling import span
+from .weather_service import DeadlineExceededError, InvalidLocationError, OpenWeatherMapDownError, RateLimitExceededError, WeatherAPIError, WeatherService
+
+_UNCHANGED = object() # update_event default for fields where None (clear) is a meaningful value
 
 class Event:
-    def __init__(self, event_id, name, location, date, event_type):
+    def __init__(self, event_id, name, location, date, event_type, start_time=None, end_time=None):
         self.event_id = event_id
         self.name = name
         self.location = location
         self.date = date  # Format: YYYY-MM-DD
         self.event_type = event_type
+        self.start_time = start_time # Optional local start time, format: HH:MM
+        self.end_time = end_time # Optional local end time, format: HH:MM
         self.weather_data = None  # Store last fetched weather data
         self.suitability_score = None # Store last calculated suitability score
 
@@ -18,6 +28,8 @@ class Event:
             "location": self.location,
             "date": self.date,
             "event_type": self.event_type,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
             "weather_data": self.weather_data,
             "suitability_score": self.suitability_score
         }
@@ -29,12 +41,20 @@ class Event:
             name=data["name"],
             location=data["location"],
             date=data["date"],
-            event_type=data["event_type"]
+            event_type=data["event_type"],
+            start_time=data.get("start_time"),
+            end_time=data.get("end_time")
         )
         event.weather_data = data.get("weather_data")
         event.suitability_score = data.get("suitability_score")
         return event
 
+    def time_window(self):
+        # (start minute, end minute) when the event has a time of day, otherwise None (whole day)
+        if self.start_time and self.end_time:
+            return parse_time_window(self.start_time, self.end_time)
+        return None
+
 class EventWeatherAnalysis:
     def __init__(self, event_id, location, date, weather_details, suitability_score, recommendation=None):
         self.event_id = event_id
@@ -45,9 +65,17 @@ class EventWeatherAnalysis:
         self.recommendation = recommendation
 
 class EventService:
-    def __init__(self, weather_service: WeatherService, db):
+    def __init__(self, weather_service: WeatherService, db, analytics=None):
         self.weather_service = weather_service
         self.events_collection = db.events # MongoDB collection for events
+        self.counters_collection = db.counters # MongoDB collection for ID sequences
+        self.analytics = analytics # Optional AnalyticsService; keeps suitability rollups current
+        self._event_id_counter_seeded = False
+
+    BULK_INSERT_BATCH_SIZE = 1000
+    MAX_REPORTED_BULK_ERRORS = 1000
+    MAX_OPTIMIZER_LOCATIONS = 25
+    MAX_OPTIMIZER_TOP_K = 100
 
     def _calculate_suitability_score(self, event_type, weather_data):
         if not weather_data:
@@ -89,25 +117,52 @@ class EventService:
         
         return suitability_text, score
 
-    def create_event(self, name, location, date_str, event_type):
-        event_id = self.events_collection.count_documents({}) + 1
+    def _allocate_event_ids(self, count):
+        # Reserves a contiguous block of event IDs with a single atomic $inc on the counter document
+        if not self._event_id_counter_seeded:
+            # Seed the counter from the highest existing ID so it never hands out an ID already in use
+            latest = self.events_collection.find_one({}, {"event_id": 1}, sort=[("event_id", -1)])
+            self.counters_collection.update_one(
+                {"_id": "event_id"},
+                {"$max": {"seq": latest["event_id"] if latest else 0}},
+                upsert=True
+            )
+            self._event_id_counter_seeded = True
+
+        counter = self.counters_collection.find_one_and_update(
+            {"_id": "event_id"},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        last_id = counter["seq"]
+        return range(last_id - count + 1, last_id + 1)
+
+    def create_event(self, name, location, date_str, event_type, start_time=None, end_time=None):
+        if start_time or end_time:
+            parse_time_window(start_time, end_time) # Raises ValueError for a malformed or partial window
+        event_id = self._allocate_event_ids(1)[0]
         event = Event(
             event_id=event_id,
             name=name,
             location=location,
             date=date_str,
-            event_type=event_type
+            event_type=event_type,
+            start_time=start_time,
+            end_time=end_time
         )
         self.events_collection.insert_one(event.to_dict())
         return event.to_dict()
 
     def get_event(self, event_id):
-        event_data = self.events_collection.find_one({"event_id": event_id})
+        with span("mongo.events.find_one"):
+            event_data = self.events_collection.find_one({"event_id": event_id})
         if event_data:
             return Event.from_dict(event_data).to_dict()
         return None
 
-    def update_event(self, event_id, name=None, location=None, date_str=None, event_type=None):
+    def update_event(self, event_id, name=None, location=None, date_str=None, event_type=None, start_time=_UNCHANGED, end_time=_UNCHANGED):
+        # start_time/end_time: omit to keep, None (or "") to remove, HH:MM to set
         event_data = self.events_collection.find_one({"event_id": event_id})
         if not event_data:
             return None
@@ -118,33 +173,149 @@ class EventService:
         if location: event.location = location
         if date_str: event.date = date_str
         if event_type: event.event_type = event_type
+        if start_time is not _UNCHANGED: event.start_time = start_time or None
+        if end_time is not _UNCHANGED: event.end_time = end_time or None
+        if event.start_time or event.end_time:
+            parse_time_window(event.start_time, event.end_time)
         
-        self.events_collection.update_one(
+        # Only the editable fields are written, so a concurrent analysis's score is not overwritten
+        updated_fields = {key: value for key, value in event.to_dict().items() if key not in ("weather_data", "suitability_score")}
+        update = {"$set": updated_fields}
+        # The stored weather and score describe the old place, date, type and time; they no longer apply
+        analysis_fields = ("location", "date", "event_type", "start_time", "end_time")
+        analysis_stale = any(updated_fields[field] != event_data.get(field) for field in analysis_fields)
+        if analysis_stale:
+            update["$unset"] = {"weather_data": "", "suitability_score": ""}
+        previous_event = self.events_collection.find_one_and_update(
             {"event_id": event_id},
-            {"$set": event.to_dict()}
+            update,
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
         )
-        return event.to_dict()
+        if not previous_event:
+            return None
+        current_event = dict(previous_event, **updated_fields)
+        if analysis_stale:
+            current_event["weather_data"] = None
+            current_event["suitability_score"] = None
+        current_event = Event.from_dict(current_event).to_dict()
+        # Withdraws the old contribution when the analysis was cleared; otherwise a no-op
+        self._record_suitability_change(previous_event, current_event)
+        return current_event
 
     def get_all_events(self):
         return [Event.from_dict(event).to_dict() for event in self.events_collection.find()]
 
+    def iter_all_events(self, batch_size=1000):
+        # Cursor-backed generator for exports; never materializes the whole collection
+        cursor = self.events_collection.find({}, {"_id": 0}, batch_size=batch_size).sort("event_id", 1)
+        for event in cursor:
+            yield Event.from_dict(event).to_dict()
+
+    def _insert_event_batch(self, batch, report):
+        # batch is a list of (row_number, row); IDs are allocated in one block per batch
+        event_ids = self._allocate_event_ids(len(batch))
+        documents = []
+        for (row_number, row), event_id in zip(batch, event_ids):
+            documents.append(Event(event_id, row["name"], row["location"], row["date"], row["event_type"],
+                                   start_time=row.get("start_time"), end_time=row.get("end_time")).to_dict())
+
+        try:
+            result = self.events_collection.insert_many(documents, ordered=False)
+            report["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # ordered=False keeps going past failures; map each write error back to its input row
+            failed_indexes = set()
+            for write_error in e.details.get("writeErrors", []):
+                failed_indexes.add(write_error["index"])
+                self._record_bulk_error(report, batch[write_error["index"]][0], write_error.get("errmsg", "Insert failed."))
+            report["inserted"] += len(documents) - len(failed_indexes)
+
+        # Document dicts gain an ObjectId from insert_many; drop the batch so memory stays flat
+        documents.clear()
+
+    def _record_bulk_error(self, report, row_number, message):
+        report["failed"] += 1
+        if len(report["errors"]) < self.MAX_REPORTED_BULK_ERRORS:
+            report["errors"].append({"row": row_number, "error": message})
+        else:
+            report["errors_truncated"] = True
+
+    def bulk_create_events(self, binary_stream, fmt, batch_size=None):
+        # batch_size can only lower the default; a larger one would hold more of the upload in memory
+        batch_size = min(max(batch_size or self.BULK_INSERT_BATCH_SIZE, 1), self.BULK_INSERT_BATCH_SIZE)
+        report = {"format": fmt, "received": 0, "inserted": 0, "failed": 0, "errors": []}
+        batch = []
+
+        try:
+            try:
+                for row_number, row, error in iter_event_rows(binary_stream, fmt):
+                    report["received"] += 1
+                    if error:
+                        self._record_bulk_error(report, row_number, error)
+                        continue
+                    batch.append((row_number, row))
+                    if len(batch) >= batch_size:
+                        self._insert_event_batch(batch, report)
+                        batch = []
+            except BulkFormatError as e:
+                # Rows parsed before the malformed point are still inserted; the report says where parsing stopped
+                report["aborted"] = str(e)
+
+            if batch:
+                self._insert_event_batch(batch, report)
+        except PyMongoError as e:
+            # Earlier batches are already committed, so report how far the import got rather than fail outright
+            report["aborted"] = f"Database error, import stopped after {report['received']} received rows: {e}"
+        return report
+
     def analyze_event_weather(self, event_id):
         event = self.get_event(event_id)
         if not event:
             return None
 
-        weather_data = self.weather_service.get_weather_data(event["location"], event["date"])
+        # Score against the event's own time window when it has one, not the whole-day average;
+        # with no forecast slots in the window there is nothing to score
+        time_window = Event.from_dict(event).time_window()
+        weather_data = self.weather_service.get_weather_data(event["location"], event["date"], time_window=time_window)
 
         if weather_data:
             event["weather_data"] = weather_data
-            suitability_text, suitability_score = self._calculate_suitability_score(event["event_type"], weather_data)
+            with span("event.scoring"):
+                suitability_text, suitability_score = self._calculate_suitability_score(event["event_type"], weather_data)
             event["suitability_score"] = {"text": suitability_text, "score": suitability_score}
+            # The pre-update document is the analysis whose rollup contribution this one replaces;
+            # reading it atomically with the write keeps concurrent analyses from double counting.
+            # The filter pins the fields the analysis was computed for, so a result for an event
+            # that was edited (or deleted) meanwhile is dropped instead of attached to the new details.
+            analyzed_filter = {"event_id": event_id}
+            for field in ("location", "date", "event_type", "start_time", "end_time"):
+                analyzed_filter[field] = event.get(field)
+            previous_event = self.events_collection.find_one_and_update(
+                analyzed_filter,
+                {"$set": {"weather_data": weather_data, "suitability_score": event["suitability_score"]}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.BEFORE
+            )
+            if not previous_event:
+                print(f"Event {event_id} changed during weather analysis; discarding the stale result.")
+                return None
+            self._record_suitability_change(previous_event, event)
             return event
         else:
             event["weather_data"] = None
             event["suitability_score"] = None
             return None
 
+    def _record_suitability_change(self, previous_event, current_event):
+        # Rollups are derived data; a failed refresh is logged and corrected by the next rebuild
+        if self.analytics is None:
+            return
+        try:
+            self.analytics.record_suitability_change(previous_event, current_event)
+        except PyMongoError as e:
+            print(f"Failed to update suitability rollups for event {current_event.get('event_id')}: {e}")
+
     def get_event_suitability(self, event_id):
         event = self.get_event(event_id)
         if not event:
@@ -157,9 +328,10 @@ class EventService:
             return None
 
         original_date = datetime.strptime(event["date"], "%Y-%m-%d").date()
+        time_window = Event.from_dict(event).time_window()
         alternatives = []
 
-        today = datetime.now().date()
+        today = self.weather_service.now().date()
         forecast_end_date = today + timedelta(days=5)
 
         # Consider dates from today up to 5 days in the future for alternatives
@@ -171,9 +343,10 @@ class EventService:
             if alternative_date == original_date and alternative_date >= today: # Only skip if original date is not in the past
                 continue
 
-            weather_data = self.weather_service.get_weather_data(event["location"], alternative_date_str)
+            weather_data = self.weather_service.get_weather_data(event["location"], alternative_date_str, time_window=time_window)
             if weather_data:
-                suitability_text, suitability_score = self._calculate_suitability_score(event["event_type"], weather_data)
+                with span("event.scoring"):
+                    suitability_text, suitability_score = self._calculate_suitability_score(event["event_type"], weather_data)
                 alternatives.append({
                     "date": alternative_date_str,
                     "weather": weather_data,
@@ -188,30 +361,24 @@ class EventService:
         if not event:
             return None, {"error": "Event not found.", "status_code": 404}
 
-        forecast_data, error = self.weather_service.get_5day_3hour_forecast(event["location"])
+        forecast_response, error = self.weather_service.get_5day_3hour_forecast(event["location"])
         if error:
             return None, error
+        forecast_data = (forecast_response or {}).get('list')
         if not forecast_data:
             return None, {"error": "No forecast data available for trends analysis.", "status_code": 404}
 
-        # Group forecasts by day and calculate daily average suitability scores
+        # Group forecasts by the venue's local day (as the cached daily summaries do) and average the scores
+        tz_offset_seconds = forecast_response.get('city', {}).get('timezone', 0)
         daily_suitability = {}
-        for item in forecast_data:
-            forecast_date_str = datetime.fromtimestamp(item['dt']).strftime("%Y-%m-%d")
-            # Create a simplified weather info dictionary for scoring based on 3-hour data
-            weather_info = {
-                "temperature": item['main']['temp'],
-                "humidity": item['main']['humidity'],
-                "description": item['weather'][0]['description'] if item.get('weather') else "N/A",
-                "main": item['weather'][0]['main'] if item.get('weather') else "N/A",
-                "wind_speed": item['wind']['speed'],
-                "precipitation": item.get('rain', {}).get('3h', 0) or item.get('snow', {}).get('3h', 0)
-            }
-            _, score = self._calculate_suitability_score(event["event_type"], weather_info)
+        with span("event.scoring", slots=len(forecast_data)):
+            for item in forecast_data:
+                slot = slot_from_forecast_item(item, tz_offset_seconds)
+                _, score = self._calculate_suitability_score(event["event_type"], slot)
             
-            if forecast_date_str not in daily_suitability:
-                daily_suitability[forecast_date_str] = []
-            daily_suitability[forecast_date_str].append(score)
+                if slot["date"] not in daily_suitability:
+                    daily_suitability[slot["date"]] = []
+                daily_suitability[slot["date"]].append(score)
         
         # Calculate average score for each day
         average_daily_scores = {
@@ -239,13 +406,16 @@ class EventService:
         
         return {"trend": trend, "message": message, "daily_scores": average_daily_scores}, None
 
-    def compare_weather_across_locations(self, locations, target_date, event_type):
+    def compare_weather_across_locations(self, locations, target_date, event_type, time_window=None, daypart=None):
+        if daypart and daypart not in DAYPARTS:
+            raise ValueError(f"Invalid daypart '{daypart}'. Use one of: {', '.join(DAYPARTS)}.")
         results = []
         for loc in locations:
             try:
-                weather_data = self.weather_service.get_weather_data(loc, target_date)
+                weather_data = self.weather_service.get_weather_data(loc, target_date, time_window=time_window, daypart=daypart)
                 if weather_data:
-                    suitability_text, suitability_score = self._calculate_suitability_score(event_type, weather_data)
+                    with span("event.scoring"):
+                        suitability_text, suitability_score = self._calculate_suitability_score(event_type, weather_data)
                     results.append({
                         "location": loc,
                         "date": target_date,
@@ -253,7 +423,9 @@ class EventService:
                         "suitability": {"text": suitability_text, "score": suitability_score}
                     })
                 else:
-                    results.append({"location": loc, "date": target_date, "error": "Weather data not available for the specified date range."})
+                    results.append({"location": loc, "date": target_date, "error": "Weather data not available for the specified date or period."})
+            except DeadlineExceededError:
+                raise # The whole request is out of time; don't keep going with the remaining locations
             except (WeatherAPIError, InvalidLocationError, RateLimitExceededError, OpenWeatherMapDownError) as e: # type: ignore
                 results.append({"location": loc, "date": target_date, "error": str(e), "status_code": e.status_code if hasattr(e, 'status_code') else 500})
             except Exception as e:
@@ -263,6 +435,102 @@ class EventService:
         results.sort(key=lambda x: x["suitability"]["score"] if "suitability" in x else -1, reverse=True)
         return results, None
 
+    def optimize_event_plan(self, event_type, locations, start_date, end_date, top_k=5, min_score=None,
+                            exclude_dates=None, preferred_daypart=None, time_window=None):
+        # Scores the whole location x date grid from one forecast bundle per location and keeps
+        # the top_k combinations in a bounded min-heap instead of sorting every candidate.
+        if not locations:
+            raise ValueError("At least one candidate location is required.")
+        if len(locations) > self.MAX_OPTIMIZER_LOCATIONS:
+            raise ValueError(f"At most {self.MAX_OPTIMIZER_LOCATIONS} candidate locations are supported.")
+        if not 1 <= top_k <= self.MAX_OPTIMIZER_TOP_K:
+            raise ValueError(f"top_k must be between 1 and {self.MAX_OPTIMIZER_TOP_K}.")
+        if preferred_daypart and preferred_daypart not in DAYPARTS:
+            raise ValueError(f"Invalid daypart '{preferred_daypart}'. Use one of: {', '.join(DAYPARTS)}.")
+
+        start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if end_date_obj < start_date_obj:
+            raise ValueError("end_date must not be before start_date.")
+
+        excluded = set()
+        if exclude_dates is not None:
+            if not isinstance(exclude_dates, list):
+                raise ValueError("exclude_dates must be a list of dates in YYYY-MM-DD format.")
+            for excluded_date in exclude_dates:
+                try:
+                    excluded.add(datetime.strptime(excluded_date, "%Y-%m-%d").date().isoformat())
+                except (TypeError, ValueError):
+                    raise ValueError(f"Invalid exclude_dates entry {excluded_date!r}, expected YYYY-MM-DD.")
+
+        # Only today and the 5-day forecast range have data on the free tier. Today only has
+        # current conditions, so it cannot be scored for a daypart or time window at all.
+        today = self.weather_service.now().date()
+        period_requested = bool(preferred_daypart or time_window)
+        first_date = max(start_date_obj, today + timedelta(days=1) if period_requested else today)
+        last_date = min(end_date_obj, today + timedelta(days=5))
+        candidate_dates = []
+        current_date = first_date
+        while current_date <= last_date:
+            if current_date.isoformat() not in excluded:
+                candidate_dates.append(current_date)
+            current_date += timedelta(days=1)
+
+        top = [] # Min-heap of (score, -date ordinal, -location index, result); the root is the weakest kept result
+        evaluated = 0
+        errors = []
+        skipped = []
+        for location_index, loc in enumerate(locations):
+            if not candidate_dates:
+                break
+            try:
+                bundles = self.weather_service.get_forecast_bundles(loc, candidate_dates)
+            except DeadlineExceededError:
+                raise
+            except (WeatherAPIError, InvalidLocationError, RateLimitExceededError, OpenWeatherMapDownError) as e: # type: ignore
+                errors.append({"location": loc, "error": str(e), "status_code": e.status_code if hasattr(e, 'status_code') else 500})
+                continue
+
+            with span("event.scoring", location=loc, dates=len(candidate_dates)):
+                for date_obj in candidate_dates:
+                    bundle = bundles.get(date_obj.isoformat())
+                    if not bundle:
+                        continue
+                    weather_data = self.weather_service.select_period(bundle, time_window=time_window, daypart=preferred_daypart)
+                    if weather_data is None:
+                        # No 3-hour slots for the period (e.g. today, served from current conditions);
+                        # a whole-day reading must not be ranked against real period forecasts
+                        skipped.append({"location": loc, "date": date_obj.isoformat(),
+                                        "reason": "No forecast available for the requested period."})
+                        continue
+                    suitability_text, suitability_score = self._calculate_suitability_score(event_type, weather_data)
+                    evaluated += 1
+                    if min_score is not None and suitability_score < min_score:
+                        continue
+
+                    # Ties go to earlier dates, then to locations listed first
+                    entry = (suitability_score, -date_obj.toordinal(), -location_index, {
+                        "location": loc,
+                        "date": date_obj.isoformat(),
+                        "period": weather_data.get("period", "day"),
+                        "weather": weather_data,
+                        "suitability": {"text": suitability_text, "score": suitability_score}
+                    })
+                    if len(top) < top_k:
+                        heapq.heappush(top, entry)
+                    elif entry[:3] > top[0][:3]:
+                        heapq.heapreplace(top, entry)
+
+        results = [entry[3] for entry in sorted(top, key=lambda entry: entry[:3], reverse=True)]
+        return {
+            "event_type": event_type,
+            "date_range": {"start": first_date.isoformat(), "end": last_date.isoformat()},
+            "evaluated": evaluated,
+            "results": results,
+            "errors": errors,
+            "skipped": skipped
+        }
+
     # Smart Notifications Logic
     def check_for_significant_weather_change(self, event_id):
         event = self.get_event(event_id)
@@ -321,6 +589,8 @@ class EventService:
             else:
                 return {"message": f"No significant weather change detected for {event['name']} in {event['location']} on {event['date']}.", "status": "no_change"}
 
+        except DeadlineExceededError:
+            raise
         except (WeatherAPIError, InvalidLocationError, RateLimitExceededError, OpenWeatherMapDownError) as e:
             return {"error": f"Error checking weather change: {e}", "status": "error"}
 
@@ -373,5 +643,7 @@ class EventService:
 
             return {"summary": "\n".join(summary_parts), "status": "success"}
 
+        except DeadlineExceededError:
+            raise
         except (WeatherAPIError, InvalidLocationError, RateLimitExceededError, OpenWeatherMapDownError) as e:
             return {"error": f"Error generating reminder summary: {e}", "status": "error"} 
\ No newline at end of file
@@ -0,0 +1,142 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+# Single-pass aggregation of the OpenWeatherMap 5-day / 3-hour forecast list.
+# One walk over the list produces, for every day, the whole-day summary and the per-daypart
+# summaries, plus the compact 3-hour slots so any event time window can be summarized later
+# from cache without another upstream call.
+
+SLOT_MINUTES = 180 # Each forecast entry covers the 3 hours starting at its timestamp
+
+# name -> (start minute, end minute) of the local day, by slot start time
+DAYPARTS = {
+    "night": (0, 6 * 60),
+    "morning": (6 * 60, 12 * 60),
+    "afternoon": (12 * 60, 18 * 60),
+    "evening": (18 * 60, 24 * 60),
+}
+
+
+def parse_time_of_day(value):
+    # "HH:MM" -> minutes since midnight; "24:00" is allowed as an end of day
+    try:
+        hours, minutes = (int(part) for part in value.split(":"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid time '{value}', expected HH:MM.")
+    if not (0 <= minutes < 60 and (0 <= hours < 24 or (hours == 24 and minutes == 0))):
+        raise ValueError(f"Invalid time '{value}', expected HH:MM.")
+    return hours * 60 + minutes
+
+
+def parse_time_window(start, end):
+    start_minute = parse_time_of_day(start)
+    end_minute = parse_time_of_day(end)
+    if end_minute <= start_minute:
+        raise ValueError(f"Time window end {end} must be after start {start} on the same day.")
+    return start_minute, end_minute
+
+
+def format_time_window(window):
+    start_minute, end_minute = window
+    return f"{start_minute // 60:02d}:{start_minute % 60:02d}-{end_minute // 60:02d}:{end_minute % 60:02d}"
+
+
+def slot_from_forecast_item(item, tz_offset_seconds=0):
+    local_time = datetime.fromtimestamp(item['dt'], tz=timezone.utc) + timedelta(seconds=tz_offset_seconds)
+    weather = item.get('weather') or [{}]
+    return {
+        "date": local_time.strftime("%Y-%m-%d"),
+        "time": local_time.strftime("%H:%M"),
+        "minute": local_time.hour * 60 + local_time.minute,
+        "temperature": item['main']['temp'],
+        "humidity": item['main']['humidity'],
+        "wind_speed": item['wind']['speed'],
+        "precipitation": item.get('rain', {}).get('3h', 0) or item.get('snow', {}).get('3h', 0),
+        "description": weather[0].get('description', "N/A"),
+        "main": weather[0].get('main', "N/A"),
+    }
+
+
+def slot_overlaps(slot, window):
+    return slot["minute"] < window[1] and slot["minute"] + SLOT_MINUTES > window[0]
+
+
+class _SummaryAccumulator:
+    __slots__ = ("count", "temp_sum", "temp_min", "temp_max", "humidity_sum", "wind_sum", "precipitation", "descriptions", "mains")
+
+    def __init__(self):
+        self.count = 0
+        self.temp_sum = 0.0
+        self.temp_min = None
+        self.temp_max = None
+        self.humidity_sum = 0.0
+        self.wind_sum = 0.0
+        self.precipitation = 0
+        self.descriptions = Counter()
+        self.mains = Counter()
+
+    def add(self, slot):
+        temp = slot["temperature"]
+        self.count += 1
+        self.temp_sum += temp
+        self.temp_min = temp if self.temp_min is None else min(self.temp_min, temp)
+        self.temp_max = temp if self.temp_max is None else max(self.temp_max, temp)
+        self.humidity_sum += slot["humidity"]
+        self.wind_sum += slot["wind_speed"]
+        self.precipitation += slot["precipitation"]
+        self.descriptions[slot["description"]] += 1
+        self.mains[slot["main"]] += 1
+
+    def summary(self):
+        # Same shape as the whole-day forecast summary, so the suitability scoring works on any of them
+        if not self.count:
+            return None
+        return {
+            "temperature": self.temp_sum / self.count,
+            "temperature_min": self.temp_min,
+            "temperature_max": self.temp_max,
+            "humidity": self.humidity_sum / self.count,
+            "wind_speed": self.wind_sum / self.count,
+            "precipitation": self.precipitation,
+            "description": self.descriptions.most_common(1)[0][0],
+            "main": self.mains.most_common(1)[0][0],
+        }
+
+
+def summarize_slots(slots, window=None):
+    accumulator = _SummaryAccumulator()
+    for slot in slots:
+        if window is None or slot_overlaps(slot, window):
+            accumulator.add(slot)
+    return accumulator.summary()
+
+
+def aggregate_forecast(forecast_list, tz_offset_seconds=0):
+    # Returns {date_str: {"summary", "dayparts", "slots"}}, with days in the location's local time
+    days = {}
+
+    for item in forecast_list:
+        slot = slot_from_forecast_item(item, tz_offset_seconds)
+        day = days.get(slot["date"])
+        if day is None:
+            day = days[slot["date"]] = {
+                "summary": _SummaryAccumulator(),
+                "dayparts": {},
+                "slots": [],
+            }
+
+        day["summary"].add(slot)
+        for name, (start_minute, end_minute) in DAYPARTS.items():
+            if start_minute <= slot["minute"] < end_minute:
+                day["dayparts"].setdefault(name, _SummaryAccumulator()).add(slot)
+                break
+        day["slots"].append(slot)
+
+    return {
+        date_str: {
+            "summary": day["summary"].summary(),
+            "dayparts": {name: acc.summary() for name, acc in day["dayparts"].items()},
+            "slots": day["slots"],
+        }
+        for date_str, day in days.items()
+    }
@@ -0,0 +1,243 @@
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from datetime import datetime
+
+# Per-request profiling.
+#   * Spans: cheap timing records around upstream calls, cache lookups, Mongo reads and scoring,
+#     nested into a call tree. Recorded for every request while slow-request capture is enabled.
+#   * Stack samples: a background sampler periodically snapshots the stacks of threads serving
+#     profiled requests (admin header or sampling rate) and folds them into a call tree.
+# Profiles of sampled requests and of requests over the latency threshold are kept in a bounded
+# ring buffer for the admin endpoints. When neither is enabled, span() is a no-op.
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+MAX_SPANS_PER_PROFILE = 2000
+MAX_STACK_DEPTH = 64
+
+
+class _SpanNode:
+    __slots__ = ("name", "attrs", "started", "duration", "children")
+
+    def __init__(self, name, attrs, started):
+        self.name = name
+        self.attrs = attrs
+        self.started = started
+        self.duration = None
+        self.children = []
+
+    def to_dict(self, origin):
+        return {
+            "name": self.name,
+            "attrs": self.attrs,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+
+
+class _Span:
+    __slots__ = ("profile", "node")
+
+    def __init__(self, profile, name, attrs):
+        self.profile = profile
+        self.node = _SpanNode(name, attrs, 0.0)
+
+    def __enter__(self):
+        profile = self.profile
+        self.node.started = time.perf_counter()
+        if profile.span_count < MAX_SPANS_PER_PROFILE:
+            profile.stack[-1].children.append(self.node)
+            profile.span_count += 1
+        else:
+            profile.dropped_spans += 1
+        profile.stack.append(self.node)
+        return self.node
+
+    def __exit__(self, exc_type, exc, tb):
+        self.node.duration = time.perf_counter() - self.node.started
+        if exc_type is not None:
+            self.node.attrs["error"] = exc_type.__name__
+        self.profile.stack.pop()
+        return False
+
+
+class RequestProfile:
+    def __init__(self, profile_id, method, path, sampled, reason=None):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.reason = reason
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.now().isoformat()
+        self.started = time.perf_counter()
+        self.root = _SpanNode("request", {"method": method, "path": path}, self.started)
+        self.stack = [self.root]
+        self.span_count = 0
+        self.dropped_spans = 0
+        self.samples = Counter() # folded stack tuple -> sample count
+        self.status_code = None
+        self.token = None # contextvars token used to restore the previous profile
+
+    def span(self, name, **attrs):
+        return _Span(self, name, attrs)
+
+    @property
+    def duration_ms(self):
+        return round(self.root.duration * 1000, 3) if self.root.duration is not None else None
+
+    def summary(self):
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "reason": self.reason,
+            "span_count": self.span_count,
+            "sample_count": sum(list(self.samples.values()))
+        }
+
+    def _sample_tree(self):
+        root = {"frame": "all", "count": 0, "children": {}}
+        for stack, count in list(self.samples.items()): # The sampler thread may still be adding
+            root["count"] += count
+            node = root
+            for frame in stack:
+                child = node["children"].get(frame)
+                if child is None:
+                    child = node["children"][frame] = {"frame": frame, "count": 0, "children": {}}
+                child["count"] += count
+                node = child
+
+        def finalize(node):
+            children = sorted(node["children"].values(), key=lambda child: child["count"], reverse=True)
+            return {"frame": node["frame"], "count": node["count"], "children": [finalize(child) for child in children]}
+        return finalize(root)
+
+    def to_dict(self):
+        profile = self.summary()
+        profile["dropped_spans"] = self.dropped_spans
+        profile["spans"] = self.root.to_dict(self.started)
+        if self.sampled:
+            profile["samples"] = self._sample_tree()
+        return profile
+
+
+def current_profile():
+    return _current_profile.get()
+
+
+def span(name, **attrs):
+    # Times a block inside the current request's profile; a no-op outside a profiled request
+    profile = _current_profile.get()
+    if profile is None:
+        return nullcontext()
+    return profile.span(name, **attrs)
+
+
+class StackSampler:
+    def __init__(self, interval_ms=5):
+        self.interval_seconds = interval_ms / 1000
+        self._profiles = {} # thread id -> RequestProfile being sampled
+        self._condition = threading.Condition() # Notified when a profile is registered
+        self._thread = None
+        self._pid = None
+
+    def register(self, profile):
+        with self._condition:
+            self._profiles[profile.thread_id] = profile
+            if self._thread is None or self._pid != os.getpid(): # Threads don't survive fork
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="request-stack-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def unregister(self, profile):
+        with self._condition:
+            if self._profiles.get(profile.thread_id) is profile:
+                del self._profiles[profile.thread_id]
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while True:
+            with self._condition:
+                while not self._profiles: # Sleep until a sampled request starts instead of polling
+                    self._condition.wait()
+            time.sleep(self.interval_seconds)
+            with self._condition:
+                if not self._profiles:
+                    continue
+                profiles = list(self._profiles.items())
+            frames = sys._current_frames()
+            for thread_id, profile in profiles:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_thread:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                profile.samples[tuple(reversed(stack))] += 1
+
+
+class RequestProfiler:
+    def __init__(self, sample_rate=0.0, slow_threshold_ms=1000, buffer_size=50, sampler_interval_ms=5):
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self.captured = deque(maxlen=buffer_size) # Ring buffer of finished profiles worth keeping
+        self.sampler = StackSampler(sampler_interval_ms)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start_request(self, method, path, force=False):
+        # force: the caller asked for a profile (admin header); otherwise sample at sample_rate
+        sampled = force or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not sampled and self.slow_threshold_ms <= 0:
+            return None
+        profile = RequestProfile(next(self._ids), method, path, sampled,
+                                 reason="requested" if force else ("sampled" if sampled else None))
+        profile.token = _current_profile.set(profile)
+        if sampled:
+            self.sampler.register(profile)
+        return profile
+
+    def finish_request(self, profile, status_code=None):
+        if profile is None:
+            return
+        profile.root.duration = time.perf_counter() - profile.started
+        profile.status_code = status_code
+        if profile.sampled:
+            self.sampler.unregister(profile)
+        try:
+            _current_profile.reset(profile.token)
+        except ValueError:
+            _current_profile.set(None) # Finished from a different context than it was started in
+
+        is_slow = self.slow_threshold_ms > 0 and profile.duration_ms >= self.slow_threshold_ms
+        if is_slow and not profile.sampled:
+            profile.reason = "slow"
+        if is_slow or profile.sampled:
+            with self._lock:
+                self.captured.append(profile)
+
+    def list_profiles(self):
+        with self._lock:
+            return [profile.summary() for profile in reversed(self.captured)]
+
+    def get_profile(self, profile_id):
+        with self._lock:
+            for profile in self.captured:
+                if profile.profile_id == profile_id:
+                    return profile.to_dict()
+        return None
@@ -0,0 +1,292 @@
+import fcntl
+import json
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from .forecast_aggregation import DAYPARTS, summarize_slots
+
+# Local archive of every current-weather observation and forecast slot we fetch, so history
+# can be served after the weather cache has expired (the free API tier has no history).
+#
+# Layout: <root>/g<grid>/<cell>/<YYYY-MM>/<column>.bin with one fixed-width column per field.
+# Appends write every column under a partition lock. Reads memory-map the columns and build a
+# sorted valid-time index per partition size, extended from the previous size after an append,
+# so day lookups and range scans are bisects.
+# At most MAX_OPEN_PARTITIONS partitions stay mapped per process (8 maps, each holding a descriptor).
+
+KIND_OBSERVED = 0
+KIND_FORECAST = 1
+
+# column name -> array typecode
+COLUMNS = {
+    "valid_ts": "q", # Unix time the values are valid for
+    "issued_ts": "q", # Unix time we fetched them
+    "kind": "B",
+    "temperature": "f",
+    "humidity": "f",
+    "wind_speed": "f",
+    "precipitation": "f",
+    "main": "B", # Index into MAIN_CATEGORIES
+}
+
+# OpenWeatherMap "main" condition groups; stored as one byte
+MAIN_CATEGORIES = ["Clear", "Clouds", "Rain", "Drizzle", "Thunderstorm", "Snow", "Mist", "Smoke", "Haze",
+                   "Dust", "Fog", "Sand", "Ash", "Squall", "Tornado"]
+UNKNOWN_MAIN = 255
+MAX_OPEN_PARTITIONS = 32
+_MAIN_CODES = {name: code for code, name in enumerate(MAIN_CATEGORIES)}
+
+
+def _main_name(code):
+    return MAIN_CATEGORIES[code] if code < len(MAIN_CATEGORIES) else "N/A"
+
+
+class _PartitionReader:
+    # Memory-mapped columns of one month partition plus a valid-time index with one row per
+    # timestamp: an observation beats a forecast, and a later forecast beats an earlier one.
+    def __init__(self, path, sizes, previous=None):
+        # previous: the reader this one supersedes; its index is extended rather than rebuilt
+        self.sizes = sizes
+        self.users = 0 # Scans currently reading this partition; guarded by the archive lock
+        self.retired = False # Evicted or superseded; closed once the last scan finishes
+        self._mmaps = []
+        self._views = []
+        self.columns = {}
+        for name, typecode in COLUMNS.items():
+            column_path = os.path.join(path, f"{name}.bin")
+            if sizes[name] == 0:
+                self.columns[name] = memoryview(b"").cast(typecode)
+                continue
+            with open(column_path, "rb") as f: # The map keeps its own descriptor
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmaps.append(mapped)
+            base = memoryview(mapped)
+            # Drop a torn trailing value so the cast sees whole items only
+            aligned = base[:len(base) - len(base) % array(typecode).itemsize]
+            self._views.extend([base, aligned])
+            self.columns[name] = aligned.cast(typecode)
+
+        # Partially written trailing rows (e.g. a crash mid-append) are ignored
+        row_count = min(len(column) for column in self.columns.values())
+        valid_ts = self.columns["valid_ts"]
+        issued_ts = self.columns["issued_ts"]
+        kind = self.columns["kind"]
+        # Columns are append-only below the rows every column has, so the rows an earlier reader
+        # indexed are unchanged and only the new ones need a pass
+        if previous is not None and previous.row_count <= row_count:
+            best = previous.best.copy()
+            first_row = previous.row_count
+        else:
+            best = {}
+            first_row = 0
+        for row in range(first_row, row_count):
+            ts = valid_ts[row]
+            current = best.get(ts)
+            if current is None or (kind[row], -issued_ts[row]) <= (kind[current], -issued_ts[current]):
+                best[ts] = row
+        self.row_count = row_count
+        self.best = best # valid time -> winning row
+        self.timestamps = sorted(best)
+        self.rows = [best[ts] for ts in self.timestamps]
+
+    def scan(self, start_ts, end_ts):
+        position = bisect_left(self.timestamps, start_ts)
+        while position < len(self.timestamps) and self.timestamps[position] < end_ts:
+            yield self.timestamps[position], self.rows[position]
+            position += 1
+
+    def close(self):
+        for view in list(self.columns.values()) + list(reversed(self._views)):
+            view.release()
+        for mapped in self._mmaps:
+            mapped.close()
+
+
+class WeatherArchive:
+    def __init__(self, root, grid_degrees):
+        self.root = root
+        self.grid_degrees = grid_degrees
+        self._readers = OrderedDict() # partition path -> _PartitionReader, least recently used first
+        self._lock = threading.Lock()
+
+    def _cell_path(self, cell_key):
+        return os.path.join(self.root, f"g{self.grid_degrees}", cell_key.replace(",", "_"))
+
+    def _partition_path(self, cell_key, month):
+        return os.path.join(self._cell_path(cell_key), month)
+
+    def _read_meta(self, cell_key):
+        try:
+            with open(os.path.join(self._cell_path(cell_key), "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def timezone_offset(self, cell_key):
+        return self._read_meta(cell_key).get("timezone", 0)
+
+    def append(self, cell_key, rows, tz_offset_seconds=None):
+        # rows: dicts with valid_ts, issued_ts, kind, temperature, humidity, wind_speed, precipitation, main
+        partitions = {}
+        for row in rows:
+            month = datetime.fromtimestamp(row["valid_ts"], tz=timezone.utc).strftime("%Y-%m")
+            partitions.setdefault(month, []).append(row)
+
+        cell_path = self._cell_path(cell_key)
+        os.makedirs(cell_path, exist_ok=True)
+        if tz_offset_seconds is not None and self._read_meta(cell_key).get("timezone") != tz_offset_seconds:
+            meta_path = os.path.join(cell_path, "meta.json")
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({"timezone": tz_offset_seconds}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+
+        for month, partition_rows in partitions.items():
+            path = self._partition_path(cell_key, month)
+            os.makedirs(path, exist_ok=True)
+            packed = {
+                "valid_ts": array("q", (int(row["valid_ts"]) for row in partition_rows)),
+                "issued_ts": array("q", (int(row["issued_ts"]) for row in partition_rows)),
+                "kind": array("B", (row["kind"] for row in partition_rows)),
+                "temperature": array("f", (float(row["temperature"] or 0) for row in partition_rows)),
+                "humidity": array("f", (float(row["humidity"] or 0) for row in partition_rows)),
+                "wind_speed": array("f", (float(row["wind_speed"] or 0) for row in partition_rows)),
+                "precipitation": array("f", (float(row["precipitation"] or 0) for row in partition_rows)),
+                "main": array("B", (_MAIN_CODES.get(row["main"], UNKNOWN_MAIN) for row in partition_rows)),
+            }
+            # One writer per partition at a time, across processes, so columns stay row-aligned
+            with open(os.path.join(path, ".lock"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._align_columns(path)
+                    for name, values in packed.items():
+                        with open(os.path.join(path, f"{name}.bin"), "ab") as f:
+                            values.tofile(f)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _align_columns(self, path):
+        # Called under the partition flock. A crash mid-append can leave columns with different
+        # row counts; cut them all back to the rows every column has, so new rows line up again.
+        rows = None
+        sizes = {}
+        for name, typecode in COLUMNS.items():
+            try:
+                sizes[name] = os.path.getsize(os.path.join(path, f"{name}.bin"))
+            except OSError:
+                sizes[name] = 0
+            column_rows = sizes[name] // array(typecode).itemsize
+            rows = column_rows if rows is None else min(rows, column_rows)
+        for name, typecode in COLUMNS.items():
+            aligned_size = rows * array(typecode).itemsize
+            if sizes[name] != aligned_size:
+                os.truncate(os.path.join(path, f"{name}.bin"), aligned_size)
+
+    def _retire(self, reader):
+        # Called with the lock held
+        reader.retired = True
+        if reader.users == 0:
+            reader.close()
+
+    def _release(self, reader):
+        with self._lock:
+            reader.users -= 1
+            if reader.retired and reader.users == 0:
+                reader.close()
+
+    def _reader(self, path):
+        # Returns the partition's reader with a use registered; callers must _release() it
+        sizes = {}
+        for name, typecode in COLUMNS.items():
+            try:
+                sizes[name] = os.path.getsize(os.path.join(path, f"{name}.bin"))
+            except OSError:
+                sizes[name] = 0
+        if not any(sizes.values()):
+            return None
+
+        with self._lock:
+            reader = self._readers.get(path)
+            if reader is not None and reader.sizes == sizes:
+                self._readers.move_to_end(path)
+                reader.users += 1
+                return reader
+
+        # The partition grew (or is new): remap it and extend the index outside the archive lock,
+        # so scans of other partitions are not held up. Only the superseded reader's index (plain
+        # Python objects) is read here, so it does not matter if it is retired meanwhile.
+        built = _PartitionReader(path, sizes, previous=reader)
+        with self._lock:
+            reader = self._readers.get(path)
+            if reader is not None and reader.sizes == sizes:
+                built.close() # A concurrent scan installed the same partition state first
+            else:
+                # A superseded reader is closed once any scan still using it finishes
+                if reader is not None:
+                    self._retire(reader)
+                reader = self._readers[path] = built
+            self._readers.move_to_end(path)
+            while len(self._readers) > MAX_OPEN_PARTITIONS:
+                self._retire(self._readers.popitem(last=False)[1]) # Least recently used
+            reader.users += 1
+            return reader
+
+    def scan(self, cell_key, start_ts, end_ts):
+        # Yields one slot dict per archived valid time in [start_ts, end_ts), in time order
+        month = datetime.fromtimestamp(start_ts, tz=timezone.utc).replace(day=1, hour=0, minute=0, second=0)
+        while month.timestamp() < end_ts:
+            reader = self._reader(self._partition_path(cell_key, month.strftime("%Y-%m")))
+            if reader is not None:
+                try:
+                    columns = reader.columns
+                    for ts, row in reader.scan(start_ts, end_ts):
+                        yield {
+                            "valid_ts": ts,
+                            "kind": columns["kind"][row],
+                            "temperature": round(columns["temperature"][row], 2),
+                            "humidity": round(columns["humidity"][row], 2),
+                            "wind_speed": round(columns["wind_speed"][row], 2),
+                            "precipitation": round(columns["precipitation"][row], 2),
+                            "main": _main_name(columns["main"][row]),
+                        }
+                finally:
+                    self._release(reader)
+            month = (month + timedelta(days=32)).replace(day=1)
+
+    def summarize_days(self, cell_key, start_date, end_date):
+        # {date_str: {"summary", "dayparts", "observations", "forecasts"}} for local days in [start_date, end_date]
+        tz_offset = self.timezone_offset(cell_key)
+        start_ts = int(datetime(start_date.year, start_date.month, start_date.day, tzinfo=timezone.utc).timestamp()) - tz_offset
+        end_ts = int(datetime(end_date.year, end_date.month, end_date.day, tzinfo=timezone.utc).timestamp()) + 86400 - tz_offset
+
+        days = {}
+        for record in self.scan(cell_key, start_ts, end_ts):
+            local_time = datetime.fromtimestamp(record["valid_ts"] + tz_offset, tz=timezone.utc)
+            slot = dict(record, description=record["main"], minute=local_time.hour * 60 + local_time.minute)
+            days.setdefault(local_time.strftime("%Y-%m-%d"), []).append(slot)
+
+        summaries = {}
+        for date_str, slots in days.items():
+            dayparts = {}
+            for name, window in DAYPARTS.items():
+                daypart_slots = [slot for slot in slots if window[0] <= slot["minute"] < window[1]]
+                if daypart_slots:
+                    dayparts[name] = summarize_slots(daypart_slots)
+            observed = sum(1 for slot in slots if slot["kind"] == KIND_OBSERVED)
+            summaries[date_str] = {
+                "summary": summarize_slots(slots),
+                "dayparts": dayparts,
+                "observations": observed,
+                "forecasts": len(slots) - observed,
+            }
+        return summaries
+
+    def close(self):
+        with self._lock:
+            for reader in self._readers.values():
+                self._retire(reader)
+            self._readers = OrderedDict()
@@ -1,7 +1,14 @@
 import requests
 from datetime import datetime, timedelta
-from collections import Counter
 import os
+import threading
+from collections import OrderedDict
+
+from .admission import remaining_seconds
+from .forecast_aggregation import DAYPARTS, aggregate_forecast, format_time_window, summarize_slots
+from .profiling import span
+from .weather_archive import KIND_FORECAST, KIND_OBSERVED
+from .weather_transport import LiveTransport
 
 # Custom Exceptions for WeatherService
 class WeatherAPIError(Exception):
@@ -26,40 +33,243 @@ class OpenWeatherMapDownError(WeatherAPIError):
         super().__init__(message)
         self.status_code = status_code
 
+class DeadlineExceededError(WeatherAPIError):
+    """Exception raised when the request deadline passes before weather data is available."""
+    def __init__(self, message="Request deadline exceeded before weather data was available.", status_code=504):
+        super().__init__(message)
+        self.status_code = status_code
+
 class WeatherService:
-    def __init__(self, api_key, base_url, db):
+    def __init__(self, api_key, base_url, db, cache_grid_degrees=0.1, transport=None, cache_write_behind=None, archive=None,
+                 upstream_timeout_seconds=10.0, clock=None):
         self.api_key = api_key
         self.base_url = base_url
+        # All upstream HTTP goes through the transport so it can be recorded to / replayed from a cassette
+        self.transport = transport or LiveTransport()
+        # Source of "now" for forecast ranges and cache freshness; replay pins it to the recording time
+        self.now = clock or datetime.now
+        # Cap on every upstream call; shortened further to whatever is left of the request deadline
+        self.upstream_timeout_seconds = upstream_timeout_seconds
+        # Optional WriteBehindQueue; when set, cache upserts are batched off the request path
+        self.cache_write_behind = cache_write_behind
+        # Optional WeatherArchive; every observation and forecast we fetch is appended to it
+        self.archive = archive
         self.weather_cache_collection = db.weather_cache # MongoDB collection for weather cache
+        self.location_grid_collection = db.location_grid # MongoDB collection mapping location strings to grid cells
         self.WEATHER_CACHE_DURATION = timedelta(hours=3)
+        # Cache entries are keyed on geocoded coordinates snapped to this grid (in degrees),
+        # so "Mumbai", "mumbai" and "Mumbai, IN" all share one forecast fetch.
+        self.CACHE_GRID_DEGREES = cache_grid_degrees
+        # In-process LRU of normalized location -> grid cell; keys are client-supplied, so it is bounded
+        self._location_grid_memo = OrderedDict()
+        self._location_grid_memo_lock = threading.Lock()
+        # LRU of grid cell -> when its forecast was last archived; a forecast refetched within the
+        # cache TTL (e.g. by uncached trend requests) is the same model run and is not archived again
+        self._forecast_archived_at = OrderedDict()
+        self._forecast_archived_lock = threading.Lock()
 
-    def get_cached_weather(self, location, date):
-        # Check MongoDB cache
-        cached_data = self.weather_cache_collection.find_one({
-            "location": location,
-            "date": date.isoformat()
-        })
-        if cached_data and (datetime.now() - datetime.fromisoformat(cached_data["timestamp"])) < self.WEATHER_CACHE_DURATION:
-            print(f"Serving weather for {location}, {date} from cache.")
-            return cached_data["data"]
+    MAX_HISTORY_RANGE_DAYS = 366
+    MAX_LOCATION_MEMO_SIZE = 10000
+
+    def _check_deadline(self):
+        # Abandons the lookup once the current request's deadline (if any) has passed
+        remaining = remaining_seconds()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededError()
+        return remaining
+
+    def _upstream_timeout(self):
+        remaining = self._check_deadline()
+        if remaining is None:
+            return self.upstream_timeout_seconds
+        return min(remaining, self.upstream_timeout_seconds) if self.upstream_timeout_seconds else remaining
+
+    def _normalize_location(self, location):
+        return " ".join(location.strip().lower().split())
+
+    def _snap_to_grid(self, lat, lon):
+        step = self.CACHE_GRID_DEGREES
+        # Round twice: once to the grid index, once more to drop float noise such as 19.100000000000001
+        return round(round(lat / step) * step, 6), round(round(lon / step) * step, 6)
+
+    def _grid_cell_key(self, cell):
+        return f"{cell[0]:.6f},{cell[1]:.6f}"
+
+    def resolve_grid_cell(self, location):
+        # Maps a location string to the (lat, lon) of its grid cell, geocoding only on a miss
+        normalized = self._normalize_location(location)
+        with self._location_grid_memo_lock:
+            cell = self._location_grid_memo.get(normalized)
+            if cell:
+                self._location_grid_memo.move_to_end(normalized)
+                return cell
+
+        with span("mongo.location_grid.find_one"):
+            mapping = self.location_grid_collection.find_one({
+                "location": normalized,
+                "grid": self.CACHE_GRID_DEGREES
+            })
+        if mapping:
+            cell = (mapping["lat"], mapping["lon"])
+        else:
+            lat, lon = self._get_coordinates_from_location(location)
+            cell = self._snap_to_grid(lat, lon)
+            self.location_grid_collection.update_one(
+                {
+                    "location": normalized,
+                    "grid": self.CACHE_GRID_DEGREES
+                },
+                {
+                    "$set": {
+                        "lat": cell[0],
+                        "lon": cell[1],
+                        "cell": self._grid_cell_key(cell)
+                    }
+                },
+                upsert=True
+            )
+            print(f"Mapped location '{location}' to grid cell {self._grid_cell_key(cell)}.")
+
+        with self._location_grid_memo_lock:
+            self._location_grid_memo[normalized] = cell
+            self._location_grid_memo.move_to_end(normalized)
+            while len(self._location_grid_memo) > self.MAX_LOCATION_MEMO_SIZE:
+                self._location_grid_memo.popitem(last=False) # Evict the least recently used location
+        return cell
+
+    def _bundle_from_cache_doc(self, cached_data):
+        if cached_data and (self.now() - datetime.fromisoformat(cached_data["timestamp"])) < self.WEATHER_CACHE_DURATION:
+            return {
+                "summary": cached_data["data"],
+                "dayparts": cached_data.get("dayparts", {}),
+                "slots": cached_data.get("slots", [])
+            }
         return None
 
-    def set_cached_weather(self, location, date, data):
-        # Store in MongoDB cache
-        self.weather_cache_collection.update_one(
-            {
-                "location": location,
+    def _cache_key(self, cell, date):
+        return (self._grid_cell_key(cell), self.CACHE_GRID_DEGREES, date.isoformat())
+
+    def _pending_cache_doc(self, cell, date):
+        if self.cache_write_behind is None:
+            return None
+        return self.cache_write_behind.get_pending(self._cache_key(cell, date))
+
+    def get_cached_forecast_bundle(self, cell, date):
+        # Writes still queued for persistence are served from memory first
+        pending = self._pending_cache_doc(cell, date)
+        if pending:
+            return self._bundle_from_cache_doc(pending)
+        # Check MongoDB cache; a bundle holds the day summary plus dayparts and 3-hour slots
+        with span("weather.cache_lookup", dates=1):
+            cached_data = self.weather_cache_collection.find_one({
+                "cell": self._grid_cell_key(cell),
+                "grid": self.CACHE_GRID_DEGREES,
                 "date": date.isoformat()
-            },
-            {
-                "$set": {
-                    "data": data,
-                    "timestamp": datetime.now().isoformat()
-                }
-            },
-            upsert=True
-        )
-        print(f"Cached weather for {location}, {date}.")
+            })
+        return self._bundle_from_cache_doc(cached_data)
+
+    def get_cached_forecast_bundles(self, cell, dates):
+        # One query for several dates of the same cell -> {date_str: bundle} for the fresh hits
+        bundles = {}
+        for date in dates:
+            bundle = self._bundle_from_cache_doc(self._pending_cache_doc(cell, date))
+            if bundle:
+                bundles[date.isoformat()] = bundle
+
+        remaining_dates = [date.isoformat() for date in dates if date.isoformat() not in bundles]
+        if not remaining_dates:
+            return bundles
+        with span("weather.cache_lookup", dates=len(remaining_dates)):
+            cached_docs = list(self.weather_cache_collection.find({
+                "cell": self._grid_cell_key(cell),
+                "grid": self.CACHE_GRID_DEGREES,
+                "date": {"$in": remaining_dates}
+            }))
+        for cached_data in cached_docs:
+            bundle = self._bundle_from_cache_doc(cached_data)
+            if bundle:
+                bundles[cached_data["date"]] = bundle
+        return bundles
+
+    def get_cached_weather(self, cell, date):
+        bundle = self.get_cached_forecast_bundle(cell, date)
+        return bundle["summary"] if bundle else None
+
+    def set_cached_weather(self, cell, date, data, dayparts=None, slots=None):
+        cache_filter = {
+            "cell": self._grid_cell_key(cell),
+            "grid": self.CACHE_GRID_DEGREES,
+            "date": date.isoformat()
+        }
+        fields = {
+            "data": data,
+            "dayparts": dayparts or {},
+            "slots": slots or [],
+            "timestamp": self.now().isoformat()
+        }
+        if self.cache_write_behind is not None:
+            # Queued for a batched bulk_write; readable from memory until it is flushed
+            self.cache_write_behind.enqueue(self._cache_key(cell, date), cache_filter, fields)
+            return
+
+        # Store in MongoDB cache
+        with span("weather.cache_write"):
+            self.weather_cache_collection.update_one(cache_filter, {"$set": fields}, upsert=True)
+        print(f"Cached weather for grid cell {self._grid_cell_key(cell)}, {date}.")
+
+    def _archive_response(self, lat, lon, endpoint, data):
+        # Keeps what we fetched after the cache TTL passes; never fails the request
+        if self.archive is None:
+            return
+        cell_key = self._grid_cell_key((lat, lon))
+        now = self.now()
+        if endpoint != "weather":
+            with self._forecast_archived_lock:
+                archived_at = self._forecast_archived_at.get(cell_key)
+                if archived_at is not None and timedelta(0) <= now - archived_at < self.WEATHER_CACHE_DURATION:
+                    return
+        issued_ts = int(now.timestamp())
+        rows = []
+        if endpoint == "weather":
+            if data.get('main') and data.get('dt'):
+                rows.append({
+                    "valid_ts": data['dt'],
+                    "issued_ts": issued_ts,
+                    "kind": KIND_OBSERVED,
+                    "temperature": data['main'].get('temp'),
+                    "humidity": data['main'].get('humidity'),
+                    "wind_speed": data.get('wind', {}).get('speed'),
+                    "precipitation": data.get('rain', {}).get('1h', 0) or data.get('snow', {}).get('1h', 0),
+                    "main": data.get('weather', [{}])[0].get('main')
+                })
+            tz_offset_seconds = data.get('timezone')
+        else:
+            for item in data.get('list', []):
+                rows.append({
+                    "valid_ts": item['dt'],
+                    "issued_ts": issued_ts,
+                    "kind": KIND_FORECAST,
+                    "temperature": item['main']['temp'],
+                    "humidity": item['main']['humidity'],
+                    "wind_speed": item['wind']['speed'],
+                    "precipitation": item.get('rain', {}).get('3h', 0) or item.get('snow', {}).get('3h', 0),
+                    "main": (item.get('weather') or [{}])[0].get('main')
+                })
+            tz_offset_seconds = data.get('city', {}).get('timezone')
+        if not rows:
+            return
+        try:
+            with span("weather.archive_write", rows=len(rows)):
+                self.archive.append(cell_key, rows, tz_offset_seconds)
+        except Exception as e:
+            print(f"Failed to archive weather for ({lat}, {lon}): {e}")
+            return
+        if endpoint != "weather":
+            with self._forecast_archived_lock:
+                self._forecast_archived_at[cell_key] = now
+                self._forecast_archived_at.move_to_end(cell_key)
+                while len(self._forecast_archived_at) > self.MAX_LOCATION_MEMO_SIZE:
+                    self._forecast_archived_at.popitem(last=False)
 
     def _get_coordinates_from_location(self, location):
         geocoding_url = "https://api.openweathermap.org/geo/1.0/direct"
@@ -69,7 +279,8 @@ class WeatherService:
             'appid': self.api_key
         }
         try:
-            response = requests.get(geocoding_url, params=params)
+            with span("weather.geocode", location=location):
+                response = self.transport.get(geocoding_url, params=params, timeout=self._upstream_timeout())
             response.raise_for_status()
             data = response.json()
             if data:
@@ -78,9 +289,12 @@ class WeatherService:
                 raise InvalidLocationError(f"Could not find coordinates for location: {location}")
         except requests.exceptions.RequestException as e:
             print(f"Error fetching coordinates for {location}: {e}")
+            self._check_deadline() # A timeout cut short by the deadline is not an outage
             raise OpenWeatherMapDownError(f"Failed to connect to Geocoding API: {e}")
 
-    def _fetch_weather_from_openweathermap(self, lat, lon, date_obj):
+    def _fetch_forecast_bundles(self, lat, lon, date_obj):
+        # Returns {date_str: bundle} for every day one upstream call covers, so the caller
+        # can cache them all. A bundle is {"summary", "dayparts", "slots"}.
         params = {
             'lat': lat,
             'lon': lon,
@@ -88,12 +302,13 @@ class WeatherService:
             'units': 'metric'
         }
 
-        today = datetime.now().date()
+        today = self.now().date()
+        forecast_end_date = today + timedelta(days=5)
         endpoint = None
 
         if date_obj == today:
             endpoint = "weather"
-        elif today < date_obj <= (today + timedelta(days=5)): # 5-day / 3-hour forecast
+        elif today < date_obj <= forecast_end_date: # 5-day / 3-hour forecast
             endpoint = "forecast"
         else:
             # Dates outside current or 5-day forecast range are not supported on free tier
@@ -102,7 +317,8 @@ class WeatherService:
 
         try:
             url = f"{self.base_url}{endpoint}"
-            response = requests.get(url, params=params)
+            with span("weather.upstream", endpoint=endpoint):
+                response = self.transport.get(url, params=params, timeout=self._upstream_timeout())
 
             # Handle API errors specifically BEFORE raise_for_status()
             if response.status_code == 401:
@@ -116,8 +332,9 @@ class WeatherService:
             # Raise HTTPError for other bad responses (e.g., 5xx, or other 4xx not explicitly handled)
             response.raise_for_status()
             data = response.json()
+            self._archive_response(lat, lon, endpoint, data)
 
-            weather_info = {}
+            bundles = {}
             if endpoint == "weather": # Current weather
                 weather_info = {
                     "temperature": data.get('main', {}).get('temp'),
@@ -130,47 +347,29 @@ class WeatherService:
                     "main": data.get('weather', [{}])[0].get('main'),
                     "precipitation": data.get('rain', {}).get('1h', 0) or data.get('snow', {}).get('1h', 0)
                 }
-            elif endpoint == "forecast": # 5-day / 3-hour forecast (summarized for the day)
-                daily_forecasts = []
-                for item in data['list']:
-                    forecast_time = datetime.fromtimestamp(item['dt'])
-                    if forecast_time.date() == date_obj:
-                        daily_forecasts.append(item)
-                
-                if daily_forecasts:
-                    temps = [item['main']['temp'] for item in daily_forecasts]
-                    humidities = [item['main']['humidity'] for item in daily_forecasts]
-                    wind_speeds = [item['wind']['speed'] for item in daily_forecasts]
-                    total_precipitation = sum(item.get('rain', {}).get('3h', 0) or item.get('snow', {}).get('3h', 0) for item in daily_forecasts)
-                    
-                    weather_descriptions = [item['weather'][0]['description'] for item in daily_forecasts]
-                    weather_main_categories = [item['weather'][0]['main'] for item in daily_forecasts]
-                    
-                    dominant_description = Counter(weather_descriptions).most_common(1)[0][0]
-                    dominant_main = Counter(weather_main_categories).most_common(1)[0][0]
-
-                    weather_info = {
-                        "temperature": sum(temps) / len(temps) if temps else None,
-                        "temperature_min": min(temps) if temps else None,
-                        "temperature_max": max(temps) if temps else None,
-                        "humidity": sum(humidities) / len(humidities) if humidities else None,
-                        "wind_speed": sum(wind_speeds) / len(wind_speeds) if wind_speeds else None,
-                        "precipitation": total_precipitation,
-                        "description": dominant_description,
-                        "main": dominant_main
-                    }
+                if data.get('main'):
+                    bundles[date_obj.isoformat()] = {"summary": weather_info, "dayparts": {}, "slots": []}
+            elif endpoint == "forecast": # 5-day / 3-hour forecast, aggregated per day, daypart and 3-hour slot in one pass
+                # Bucket slots by the location's local time so "evening" means evening at the venue
+                tz_offset_seconds = data.get('city', {}).get('timezone', 0)
+                for date_str, bundle in aggregate_forecast(data.get('list', []), tz_offset_seconds).items():
+                    # Today is served from current conditions; only cache days the forecast endpoint owns
+                    if today.isoformat() < date_str <= forecast_end_date.isoformat() and bundle["summary"]:
+                        bundles[date_str] = bundle
             
-            if not weather_info:
+            if date_obj.isoformat() not in bundles:
                 print(f"DEBUG: Raw API response for ({lat}, {lon}) on {date_obj}: {data}")
                 print(f"No relevant weather data found in API response for ({lat}, {lon}) on {date_obj}")
-                return None
-            return weather_info
+            return bundles
 
+        except WeatherAPIError:
+            raise
         except requests.exceptions.RequestException as e:
             print(f"Network or general request error fetching weather: {e}")
+            self._check_deadline()
             raise OpenWeatherMapDownError(f"Failed to connect to OpenWeatherMap API: {e}")
         except Exception as e:
-            print(f"An unexpected error occurred in _fetch_weather_from_openweathermap: {e}")
+            print(f"An unexpected error occurred in _fetch_forecast_bundles: {e}")
             raise WeatherAPIError(f"Error processing weather data: {e}")
 
     def get_hourly_forecast(self, location, date):
@@ -179,13 +378,45 @@ class WeatherService:
         return None, {"error": "Detailed hourly forecast is not available on the free OpenWeatherMap API tier.", "status_code": 400}
 
     def get_historical_weather(self, location, date):
-        # Historical weather data is not available on the free OpenWeatherMap API tier.
-        return None, {"error": "Historical weather data is not available on the free OpenWeatherMap API tier.", "status_code": 400}
+        # Served from the local archive of weather we have fetched before; the free OpenWeatherMap tier has no history
+        if self.archive is None:
+            return None, {"error": "Historical weather data is not available on the free OpenWeatherMap API tier.", "status_code": 400}
+        try:
+            date_obj = datetime.strptime(date, "%Y-%m-%d").date() if isinstance(date, str) else date
+        except ValueError:
+            return None, {"error": f"Invalid date '{date}', expected YYYY-MM-DD.", "status_code": 400}
+        if date_obj > self.now().date():
+            return None, {"error": "Historical weather is only available for today and past dates. Use the forecast endpoints for future dates.", "status_code": 400}
+
+        cell = self.resolve_grid_cell(location)
+        with span("weather.archive_read", days=1):
+            day = self.archive.summarize_days(self._grid_cell_key(cell), date_obj, date_obj).get(date_obj.isoformat())
+        if not day:
+            return None, {"error": f"No archived weather for {location} on {date_obj}.", "status_code": 404}
+        return dict(day, source="archive"), None
+
+    def get_historical_weather_range(self, location, start_date, end_date):
+        try:
+            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            return None, {"error": "start and end must be dates in YYYY-MM-DD format.", "status_code": 400}
+        if self.archive is None:
+            return None, {"error": "Historical weather data is not available on the free OpenWeatherMap API tier.", "status_code": 400}
+        if end_date_obj < start_date_obj:
+            return None, {"error": "end must not be before start.", "status_code": 400}
+        if (end_date_obj - start_date_obj).days > self.MAX_HISTORY_RANGE_DAYS:
+            return None, {"error": f"Date ranges are limited to {self.MAX_HISTORY_RANGE_DAYS} days.", "status_code": 400}
+
+        cell = self.resolve_grid_cell(location)
+        with span("weather.archive_read", days=(end_date_obj - start_date_obj).days + 1):
+            days = self.archive.summarize_days(self._grid_cell_key(cell), start_date_obj, end_date_obj)
+        return {"start": start_date_obj.isoformat(), "end": end_date_obj.isoformat(), "days": days, "source": "archive"}, None
 
     def get_5day_3hour_forecast(self, location):
-        # This method fetches the raw 5-day / 3-hour forecast data
+        # This method fetches the raw 5-day / 3-hour forecast response ("list" of 3-hour entries, "city" incl. timezone)
         try:
-            lat, lon = self._get_coordinates_from_location(location) # Get coordinates
+            lat, lon = self.resolve_grid_cell(location) # Get grid cell coordinates
             params = {
                 'lat': lat,
                 'lon': lon,
@@ -194,7 +425,8 @@ class WeatherService:
             }
 
             url = f"{self.base_url}forecast"
-            response = requests.get(url, params=params)
+            with span("weather.upstream", endpoint="forecast"):
+                response = self.transport.get(url, params=params, timeout=self._upstream_timeout())
             response.raise_for_status()
             data = response.json()
 
@@ -208,38 +440,103 @@ class WeatherService:
                 raise OpenWeatherMapDownError()
 
             if 'list' in data:
-                return data['list'], None # Return the raw list of 3-hour forecasts
+                self._archive_response(lat, lon, "forecast", data)
+                return data, None
             else:
                 return None, {"error": "No 5-day / 3-hour forecast data found.", "status_code": 404}
 
+        except DeadlineExceededError as e:
+            return None, {"error": str(e), "status_code": e.status_code}
         except requests.exceptions.RequestException as e:
             print(f"Network or general request error fetching 5-day/3-hour forecast for {location}: {e}")
+            remaining = remaining_seconds()
+            if remaining is not None and remaining <= 0: # Timed out because the request deadline passed
+                error = DeadlineExceededError()
+                return None, {"error": str(error), "status_code": error.status_code}
             return None, {"error": f"Failed to connect to OpenWeatherMap API for 5-day forecast: {e}", "status_code": 500}
         except Exception as e:
             print(f"An unexpected error occurred in get_5day_3hour_forecast: {e}")
             return None, {"error": f"An unexpected error occurred: {str(e)}", "status_code": 500}
 
-    def get_weather_data(self, location, date):
-        # Ensures date is a datetime.date object when interacting with cache and _fetch_weather_from_openweathermap
+    def select_period(self, bundle, time_window=None, daypart=None):
+        # Narrows a day bundle to a daypart or an event time window (minutes since midnight).
+        # Returns None when the period has no 3-hour slots (e.g. today, served from current
+        # conditions, or the tail of the last forecast day) rather than passing off the
+        # whole-day summary as the period's forecast.
+        if daypart:
+            if daypart not in DAYPARTS:
+                raise ValueError(f"Invalid daypart '{daypart}'. Use one of: {', '.join(DAYPARTS)}.")
+            summary = bundle["dayparts"].get(daypart)
+            return dict(summary, period=daypart) if summary else None
+        if time_window:
+            summary = summarize_slots(bundle["slots"], time_window)
+            return dict(summary, period=format_time_window(time_window)) if summary else None
+        return bundle["summary"]
+
+    def _fetch_and_cache_bundles(self, cell, date_obj):
+        # Fetch for the cell itself so every location mapped to it gets identical data
+        bundles = self._fetch_forecast_bundles(cell[0], cell[1], date_obj)
+        for date_str, day_bundle in (bundles or {}).items():
+            self.set_cached_weather(cell, datetime.strptime(date_str, "%Y-%m-%d").date(), day_bundle["summary"],
+                                    dayparts=day_bundle["dayparts"], slots=day_bundle["slots"])
+        return bundles or {}
+
+    def get_forecast_bundle(self, location, date):
+        # Cached day bundle for a location; one upstream miss fills the cache for every forecast day
         if isinstance(date, str):
             date_obj = datetime.strptime(date, "%Y-%m-%d").date()
         else:
             date_obj = date
 
-        cached_weather = self.get_cached_weather(location, date_obj)
-        if cached_weather:
-            print(f"Serving weather for {location}, {date_obj} from cache.")
-            return cached_weather
-        
-        print(f"Fetching weather for {location}, {date_obj} from OpenWeatherMap.")
         try:
-            lat, lon = self._get_coordinates_from_location(location) # Get coordinates
-            weather_data = self._fetch_weather_from_openweathermap(lat, lon, date_obj) # Pass lat, lon
-            if weather_data:
-                self.set_cached_weather(location, date_obj, weather_data)
-            return weather_data
+            self._check_deadline()
+            cell = self.resolve_grid_cell(location) # Geocoded coordinates snapped to the cache grid
+            bundle = self.get_cached_forecast_bundle(cell, date_obj)
+            if bundle:
+                print(f"Serving weather for {location}, {date_obj} from cache (grid cell {self._grid_cell_key(cell)}).")
+                return bundle
+
+            print(f"Fetching weather for {location}, {date_obj} from OpenWeatherMap.")
+            return self._fetch_and_cache_bundles(cell, date_obj).get(date_obj.isoformat())
         except WeatherAPIError as e:
             raise e
         except Exception as e:
             print(f"An unexpected error occurred while fetching weather for {location}, {date_obj}: {e}")
-            raise WeatherAPIError(f"Could not retrieve weather data: {e}") 
\ No newline at end of file
+            raise WeatherAPIError(f"Could not retrieve weather data: {e}")
+
+    def get_forecast_bundles(self, location, dates):
+        # Day bundles for many dates of one location: one cache query, and at most one
+        # forecast call (plus one current-weather call for today) on a miss.
+        try:
+            self._check_deadline()
+            cell = self.resolve_grid_cell(location)
+            bundles = self.get_cached_forecast_bundles(cell, dates)
+            missing = [date for date in dates if date.isoformat() not in bundles]
+            today = self.now().date()
+
+            # A single forecast fetch covers every date in the forecast range, so only the first miss in it needs one;
+            # dates outside the range have no data to fetch
+            forecast_end_date = today + timedelta(days=5)
+            forecast_miss = next((date for date in missing if today < date <= forecast_end_date), None)
+            if forecast_miss:
+                print(f"Fetching forecast for {location} from OpenWeatherMap.")
+                bundles.update(self._fetch_and_cache_bundles(cell, forecast_miss))
+            if today in missing:
+                bundles.update(self._fetch_and_cache_bundles(cell, today))
+
+            return {date.isoformat(): bundles[date.isoformat()] for date in dates if date.isoformat() in bundles}
+        except WeatherAPIError as e:
+            raise e
+        except Exception as e:
+            print(f"An unexpected error occurred while fetching forecast bundles for {location}: {e}")
+            raise WeatherAPIError(f"Could not retrieve weather data: {e}")
+
+    def get_weather_data(self, location, date, time_window=None, daypart=None):
+        # time_window: optional (start minute, end minute) of the event; daypart: morning/afternoon/evening/night.
+        # None when there is no forecast for the date, or none for the requested period on it.
+        if daypart and daypart not in DAYPARTS:
+            raise ValueError(f"Invalid daypart '{daypart}'. Use one of: {', '.join(DAYPARTS)}.")
+        bundle = self.get_forecast_bundle(location, date)
+        if not bundle:
+            return None
+        return self.select_period(bundle, time_window=time_window, daypart=daypart)
@@ -0,0 +1,220 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import requests
+
+# HTTP transports used by WeatherService for upstream OpenWeatherMap calls.
+#   LiveTransport      - talks to the network (default)
+#   RecordingTransport - talks to the network and appends every response to a cassette file
+#   ReplayTransport    - serves responses from a cassette with zero network access
+#
+# Cassette layout: an 8-byte magic header followed by append-only records of
+#   20-byte SHA-1 request key | status (uint16) | elapsed ms (uint32) | body length (uint32) | zlib body
+# Later records for the same request replace earlier ones, so a cassette can be re-recorded in place.
+# A record under the reserved all-zero key holds the recording time (JSON {"recorded_at": unix seconds});
+# replay pins WeatherService's clock to it so "today" and the forecast range match the recorded data.
+
+CASSETTE_MAGIC = b"OWMCAS1\n"
+RECORD_HEADER = struct.Struct(">20sHII")
+
+# Query parameters that never take part in request matching (and are never written to disk)
+IGNORED_PARAMS = ("appid",)
+
+RECORDED_AT_KEY = b"\x00" * 20
+
+
+def request_key(url, params=None):
+    params = {k: v for k, v in (params or {}).items() if k not in IGNORED_PARAMS}
+    canonical = json.dumps([url, sorted((str(k), str(v)) for k, v in params.items())])
+    return hashlib.sha1(canonical.encode("utf-8")).digest()
+
+
+class CassetteResponse:
+    """Minimal stand-in for requests.Response built from a cassette record."""
+    def __init__(self, url, status_code, content, elapsed_ms=0):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class Cassette:
+    def __init__(self, path, use_mmap=False, writable=True):
+        self.path = path
+        self.use_mmap = use_mmap
+        self.writable = writable
+        self._index = {} # request key -> (body offset, body length, status, elapsed ms)
+        self._lock = threading.Lock()
+        self._file = None
+        self._mmap = None
+        self._load()
+
+    def _load(self):
+        if self.writable and (not os.path.exists(self.path) or os.path.getsize(self.path) == 0):
+            with open(self.path, "wb") as f:
+                f.write(CASSETTE_MAGIC)
+
+        self._file = open(self.path, "r+b" if self.writable else "rb")
+        if self._file.read(len(CASSETTE_MAGIC)) != CASSETTE_MAGIC:
+            raise ValueError(f"{self.path} is not a weather cassette file.")
+
+        offset = len(CASSETTE_MAGIC)
+        size = os.path.getsize(self.path)
+        while offset + RECORD_HEADER.size <= size:
+            self._file.seek(offset)
+            key, status, elapsed_ms, length = RECORD_HEADER.unpack(self._file.read(RECORD_HEADER.size))
+            body_offset = offset + RECORD_HEADER.size
+            if body_offset + length > size:
+                break # Truncated trailing record from an interrupted recording
+            self._index[key] = (body_offset, length, status, elapsed_ms)
+            offset = body_offset + length
+
+        self._remap()
+        print(f"Loaded weather cassette {self.path} with {len(self)} recorded responses.")
+
+    def _remap(self):
+        # Called with the lock held. The previous map is not closed here since a concurrent
+        # get() may still be slicing it; it is freed with its last reference.
+        if self.use_mmap and os.path.getsize(self.path) > len(CASSETTE_MAGIC):
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._index) - (RECORDED_AT_KEY in self._index)
+
+    def get(self, key):
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        body_offset, length, status, elapsed_ms = entry
+        with self._lock:
+            mapped = self._mmap # Snapshot; put() may swap in a new map concurrently
+        if mapped is not None and body_offset + length <= len(mapped):
+            compressed = mapped[body_offset:body_offset + length]
+        else:
+            with self._lock:
+                self._file.seek(body_offset)
+                compressed = self._file.read(length)
+        return status, zlib.decompress(compressed), elapsed_ms
+
+    def put(self, key, status, content, elapsed_ms):
+        compressed = zlib.compress(content, 6)
+        record = RECORD_HEADER.pack(key, status, min(int(elapsed_ms), 0xFFFFFFFF), len(compressed)) + compressed
+        with self._lock:
+            # Pre-fork workers may record to the same cassette; the flock keeps each record whole
+            # and makes the end-of-file offset we read the one our record lands at
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                self._file.seek(0, os.SEEK_END)
+                offset = self._file.tell()
+                self._file.write(record)
+                self._file.flush()
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._index[key] = (offset + RECORD_HEADER.size, len(compressed), status, elapsed_ms)
+            if self.use_mmap:
+                self._remap()
+
+    def recorded_at(self):
+        # Unix time the cassette was (last) recorded, or None for cassettes written before it was stored
+        record = self.get(RECORDED_AT_KEY)
+        if record is None:
+            return None
+        return json.loads(record[1]).get("recorded_at")
+
+    def close(self):
+        with self._lock:
+            self._mmap = None # Dropped rather than closed, for the same reason as in _remap
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class LiveTransport:
+    def __init__(self):
+        self.session = requests.Session() # Reuses upstream connections across calls
+
+    def get(self, url, params=None, timeout=None):
+        # timeout bounds the connect and each socket read, in seconds
+        return self.session.get(url, params=params, timeout=timeout)
+
+
+class RecordingTransport:
+    def __init__(self, cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner or LiveTransport()
+        self._stamped = False
+
+    def get(self, url, params=None, timeout=None):
+        if not self._stamped:
+            # Stamped once per recording session; a cassette re-recorded later takes the newer time
+            self._stamped = True
+            self.cassette.put(RECORDED_AT_KEY, 200, json.dumps({"recorded_at": time.time()}).encode("utf-8"), 0)
+        started = time.monotonic()
+        response = self.inner.get(url, params=params, timeout=timeout)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.cassette.put(request_key(url, params), response.status_code, response.content, elapsed_ms)
+        return response
+
+
+class ReplayTransport:
+    def __init__(self, cassette, latency_ms=None):
+        # latency_ms: None for no delay, a number for a fixed delay, or "recorded" to replay the captured upstream latency
+        self.cassette = cassette
+        self.latency_ms = latency_ms
+        recorded_at = cassette.recorded_at()
+        self._recorded_now = datetime.fromtimestamp(recorded_at) if recorded_at is not None else None
+
+    def now(self):
+        # Clock for WeatherService: pinned to the recording time so replays select the same dates forever
+        return self._recorded_now or datetime.now()
+
+    def get(self, url, params=None, timeout=None):
+        record = self.cassette.get(request_key(url, params))
+        if record is None:
+            # Surfaces through the normal network-error path, i.e. as OpenWeatherMapDownError
+            raise requests.exceptions.ConnectionError(f"No recorded response in cassette {self.cassette.path} for {url}")
+        status, content, elapsed_ms = record
+
+        delay_ms = elapsed_ms if self.latency_ms == "recorded" else self.latency_ms
+        if delay_ms:
+            if timeout is not None and float(delay_ms) / 1000 > timeout:
+                # Behave like a live upstream that is slower than the caller's timeout
+                time.sleep(timeout)
+                raise requests.exceptions.ReadTimeout(f"Replayed response for {url} exceeded the {timeout:.3f}s timeout")
+            time.sleep(float(delay_ms) / 1000)
+        return CassetteResponse(url, status, content, elapsed_ms)
+
+
+def build_transport(mode=None, cassette_path=None, use_mmap=False, latency_ms=None):
+    # mode: "live" (default), "record" or "replay"
+    mode = (mode or "live").lower()
+    if mode == "live":
+        return LiveTransport()
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown weather transport mode '{mode}'. Use live, record or replay.")
+    if not cassette_path:
+        raise ValueError(f"Weather transport mode '{mode}' requires a cassette path.")
+
+    cassette = Cassette(cassette_path, use_mmap=use_mmap, writable=(mode == "record"))
+    if mode == "record":
+        return RecordingTransport(cassette)
+    return ReplayTransport(cassette, latency_ms=latency_ms)